@@ -115,6 +115,6 @@ if __name__ == "__main__":
     except PastebinError as e:
         print('[-] Pastebin user details: %s' % own_user)
     # print(own_user)
-    users = UsersParser.parse(str(own_user))
+    users = UsersParser.parse(own_user)
     for user in users:
         print(user)
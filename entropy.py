@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    entropy.py - High-entropy token prefilter for paste contents.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+import argparse
+from collections import Counter
+import math
+import os
+import re
+import string
+import time
+
+# NumPy is optional: without it, a slower pure Python scan is used
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Bytes which may be part of a token: base64, URL-safe base64 and hex
+_token_chars = (string.ascii_letters + string.digits + '+/=_-').encode('ascii')
+
+# Character classes: upper case, lower case, digits, symbols
+_char_classes = (string.ascii_uppercase.encode('ascii'),
+                 string.ascii_lowercase.encode('ascii'),
+                 string.digits.encode('ascii'),
+                 b'+/=_-')
+
+
+class SecretCandidate:
+    """High-entropy token found in a paste content.
+    """
+
+    __slots__ = ('index', 'start', 'end', 'entropy', 'classes', 'token')
+
+    def __init__(self, index, start, end, entropy, classes, token):
+        # Index of the content in the scanned batch
+        self.index = index
+        self.start = start
+        self.end = end
+        # Shannon entropy, in bits per byte
+        self.entropy = entropy
+        # Number of character classes used by the token
+        self.classes = classes
+        self.token = token
+
+    def __str__(self):
+        return 'SecretCandidate: content %d span %d-%d entropy %.2f \
+classes %d token %s' % (self.index, self.start, self.end, self.entropy,
+                        self.classes, self.token)
+
+
+class EntropyScanner:
+    """Scanner of paste contents for high-entropy tokens, such as leaked
+    keys and passwords.
+
+    Contents are split into runs of base64 or hex characters; runs long
+    enough, with an entropy and a number of character classes above the
+    thresholds, are reported. With NumPy, a whole batch of contents is
+    tokenised and measured with array operations instead of a loop over
+    the characters.
+    """
+
+    def __init__(self, min_length=20, threshold=3.5, min_classes=2,
+                 use_numpy=None, chunk_bytes=16 << 20):
+        """ New EntropyScanner object.
+
+        @type   min_length: int
+        @param  min_length: (Optional) Minimum length of a token.
+
+        @type   threshold: float
+        @param  threshold: (Optional) Minimum entropy of a token, in bits
+        per byte.
+
+        @type   min_classes: int
+        @param  min_classes: (Optional) Minimum number of character classes
+        (upper case, lower case, digits, symbols) of a token.
+
+        @type   use_numpy: boolean
+        @param  use_numpy: (Optional) Whether to use NumPy. Defaults to
+        using it when it is installed.
+
+        @type   chunk_bytes: int
+        @param  chunk_bytes: (Optional) Bytes of content measured at once
+        with NumPy, bounding its memory usage.
+        """
+
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        elif use_numpy and numpy is None:
+            raise ImportError('NumPy is not installed')
+        self.min_length = min_length
+        self.threshold = threshold
+        self.min_classes = min_classes
+        self.use_numpy = use_numpy
+        self.chunk_bytes = chunk_bytes
+        self._token_re = re.compile(b'[%s]{%d,}' % (
+            re.escape(_token_chars), min_length))
+        if use_numpy:
+            self._token_table = numpy.zeros(256, dtype=bool)
+            self._token_table[numpy.frombuffer(_token_chars,
+                                               dtype=numpy.uint8)] = True
+            self._class_table = numpy.zeros(256, dtype=numpy.int64)
+            for (i, chars) in enumerate(_char_classes):
+                self._class_table[numpy.frombuffer(chars,
+                                                   dtype=numpy.uint8)] = i
+
+    def scan(self, content):
+        """Scan one paste content.
+
+        @type   content: bytes
+        @param  content: The content, as returned by scrape_get_data.
+
+        @rtype:     array
+        @returns:   SecretCandidate objects.
+        """
+
+        return self.scan_batch([content])
+
+    def scan_batch(self, contents):
+        """Scan a batch of paste contents at once.
+
+        @type   contents: array
+        @param  contents: Contents, as bytes or memoryviews.
+
+        @rtype:     array
+        @returns:   SecretCandidate objects, ordered by content then offset.
+        """
+
+        if not self.use_numpy:
+            candidates = []
+            for (index, content) in enumerate(contents):
+                candidates.extend(self._scan_python(index, content))
+            return candidates
+
+        # Group the contents in chunks, measured together
+        candidates = []
+        chunk = []
+        chunk_size = 0
+        for (index, content) in enumerate(contents):
+            chunk.append((index, content))
+            chunk_size += len(content)
+            if chunk_size >= self.chunk_bytes:
+                candidates.extend(self._scan_numpy(chunk))
+                chunk = []
+                chunk_size = 0
+        if chunk:
+            candidates.extend(self._scan_numpy(chunk))
+        return candidates
+
+    def _scan_python(self, index, content):
+        candidates = []
+        for match in self._token_re.finditer(content):
+            token = match.group()
+            length = len(token)
+            entropy = -sum(count / length * math.log2(count / length)
+                           for count in Counter(token).values())
+            if entropy < self.threshold:
+                continue
+            present = set(token)
+            classes = sum(1 for chars in _char_classes
+                          if not present.isdisjoint(chars))
+            if classes < self.min_classes:
+                continue
+            candidates.append(SecretCandidate(index, match.start(),
+                                              match.end(), entropy,
+                                              classes, token))
+        return candidates
+
+    def _scan_numpy(self, chunk):
+        # NUL separators keep tokens from spanning two contents
+        data = numpy.frombuffer(b'\0'.join(content for (_, content)
+                                           in chunk), dtype=numpy.uint8)
+        bases = numpy.cumsum([0] + [len(content) + 1
+                                    for (_, content) in chunk[:-1]])
+
+        # Token boundaries are the edges of the token mask
+        mask = numpy.concatenate(([0], self._token_table[data], [0]))
+        edges = numpy.flatnonzero(numpy.diff(mask.astype(numpy.int8)))
+        (starts, ends) = (edges[0::2], edges[1::2])
+        lengths = ends - starts
+        keep = lengths >= self.min_length
+        (starts, ends, lengths) = (starts[keep], ends[keep], lengths[keep])
+        tokens = len(starts)
+        if tokens == 0:
+            return []
+
+        # Token number and value of every byte of every token
+        segments = numpy.repeat(numpy.arange(tokens), lengths)
+        firsts = numpy.cumsum(lengths) - lengths
+        positions = numpy.arange(lengths.sum()) \
+            - numpy.repeat(firsts, lengths) + numpy.repeat(starts, lengths)
+        values = data[positions]
+
+        # Byte histograms of all tokens, from the distinct (token, byte)
+        (pairs, counts) = numpy.unique(segments * 256 + values,
+                                       return_counts=True)
+        pair_segments = pairs >> 8
+        probabilities = counts / lengths[pair_segments]
+        entropies = -numpy.bincount(
+            pair_segments, weights=probabilities * numpy.log2(probabilities),
+            minlength=tokens)
+
+        # Character classes used by each token
+        class_pairs = numpy.unique(segments * 4 + self._class_table[values])
+        classes = numpy.bincount(class_pairs >> 2, minlength=tokens)
+
+        selected = numpy.flatnonzero((entropies >= self.threshold)
+                                     & (classes >= self.min_classes))
+        indexes = numpy.searchsorted(bases, starts[selected], side='right') - 1
+        candidates = []
+        for (token, i) in zip(selected.tolist(), indexes.tolist()):
+            base = int(bases[i])
+            (start, end) = (int(starts[token]) - base, int(ends[token]) - base)
+            candidates.append(SecretCandidate(
+                chunk[i][0], start, end, float(entropies[token]),
+                int(classes[token]), bytes(chunk[i][1][start:end])))
+        return candidates
+
+
+def _corpus(size, secrets_every=4096):
+    """Build a benchmark corpus: text with a random token every few KB."""
+
+    words = (b'the quick brown fox jumps over the lazy dog ' * 100)
+    corpus = bytearray()
+    while len(corpus) < size:
+        corpus += words[:secrets_every]
+        corpus += b' ' + os.urandom(24).hex().encode('ascii')[:32] \
+            + b'Zq9/' + b' \n'
+    return bytes(corpus[:size])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Benchmark the high-entropy token scanner')
+    parser.add_argument('-s', '--size', dest='size', type=int, default=64,
+                        help='Size of the corpus, in MB')
+    parser.add_argument('-p', '--paste-size', dest='paste_size', type=int,
+                        default=64, help='Size of each paste, in KB')
+    args = parser.parse_args()
+
+    paste_size = args.paste_size << 10
+    pastes = [_corpus(paste_size)] * ((args.size << 20) // paste_size)
+    total = len(pastes) * paste_size
+    backends = [False] + ([True] if numpy is not None else [])
+    for use_numpy in backends:
+        scanner = EntropyScanner(use_numpy=use_numpy)
+        started = time.perf_counter()
+        candidates = scanner.scan_batch(pastes)
+        elapsed = time.perf_counter() - started
+        print('%-6s %8.1f MB/s  %d candidates' % (
+            'numpy' if use_numpy else 'python',
+            total / elapsed / (1 << 20), len(candidates)))
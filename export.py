@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    export.py - Resumable archive export of Pastebin accounts.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date
+import glob
+import gzip
+import json
+import lzma
+import os
+import tarfile
+import time
+
+from pastebin import \
+    PastebinAPI, \
+    PastebinError, \
+    PastesParserXML
+
+
+class PasteArchive:
+    """Export of every paste of an account into a compressed tar archive.
+
+    The archive is written as a series of compressed members (gzip and xz
+    both allow concatenated streams), each holding the tar entries of a
+    batch of pastes. After each member, the archive offset and the pastes it
+    holds are saved in a checkpoint file. An interrupted export truncates
+    the archive back to the last checkpoint and carries on from there. The
+    last member holds a JSON manifest of the pastes and ends the tar archive.
+    """
+
+    # Supported compressions, and their compressor factories
+    compression = {
+        'gz': lambda fileobj: gzip.GzipFile(fileobj=fileobj, mode='wb'),
+        'xz': lambda fileobj: lzma.LZMAFile(fileobj, mode='wb'),
+    }
+
+    # Name of the manifest, in the archive
+    _manifest_name = 'manifest.json'
+
+    def __init__(self, api, path, account, api_user_key=None,
+                 compression='gz', workers=4, checkpoint_every=50):
+        """ New PasteArchive object.
+
+        @type   api: PastebinAPI
+        @param  api: Client used to list and download the pastes.
+
+        @type   path: string
+        @param  path: Path of the archive.
+
+        @type   account: string
+        @param  account: Name of the account, used as the top directory of
+        the archive.
+
+        @type   api_user_key: string
+        @param  api_user_key: (Optional) The API User key of the exported
+        account. If not provided, the key of the client will be used.
+
+        @type   compression: string
+        @param  compression: (Optional) C{'gz'} or C{'xz'}.
+
+        @type   workers: int
+        @param  workers: (Optional) Number of parallel downloads.
+
+        @type   checkpoint_every: int
+        @param  checkpoint_every: (Optional) Number of pastes written between
+        two checkpoints.
+        """
+
+        if compression not in self.compression:
+            raise ValueError('Unknown compression: %s' % compression)
+        self.api = api
+        self.path = path
+        self.account = account
+        self.api_user_key = api_user_key
+        self.compression_name = compression
+        self.workers = workers
+        self.checkpoint_every = checkpoint_every
+
+    def _checkpoint_path(self):
+        return '%s.checkpoint' % self.path
+
+    def _load_checkpoint(self):
+        try:
+            with open(self._checkpoint_path(), 'r') as checkpoint_file:
+                return json.load(checkpoint_file)
+        except FileNotFoundError:
+            return {'offset': 0, 'pastes': {}}
+
+    def _save_checkpoint(self, checkpoint):
+        tmp_path = '%s.tmp' % self._checkpoint_path()
+        with open(tmp_path, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(tmp_path, self._checkpoint_path())
+
+    def _tar_entry(self, name, content, mtime):
+        info = tarfile.TarInfo('%s/%s' % (self.account, name))
+        info.size = len(content)
+        info.mtime = mtime
+        info.mode = 0o644
+        entry = info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+        padding = -len(content) % tarfile.BLOCKSIZE
+        return (entry, content, tarfile.NUL * padding)
+
+    def _write_entry(self, member, name, content, mtime):
+        for buf in self._tar_entry(name, content, mtime):
+            member.write(buf)
+
+    def _close_member(self, archive, member, checkpoint):
+        member.close()
+        archive.flush()
+        os.fsync(archive.fileno())
+        checkpoint['offset'] = archive.tell()
+        self._save_checkpoint(checkpoint)
+
+    def listing(self):
+        """Fetch and parse the current listing of the account.
+
+        @rtype:     array
+        @returns:   Array of Paste objects.
+        """
+
+        pastes = PastesParserXML.parse(
+            self.api.list_user_pastes_mdata(self.api_user_key, 1000))
+        if not isinstance(pastes, list):
+            pastes = [pastes]
+        return pastes
+
+    def export(self):
+        """Export the account, resuming an interrupted export if any.
+
+        @rtype:     dict
+        @returns:   Keys of the 'archived' pastes, and a 'failed' mapping of
+        keys to the error met while downloading them.
+        """
+
+        checkpoint = self._load_checkpoint()
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size < checkpoint['offset']:
+            # The archive was removed or truncated behind the checkpoint:
+            # nothing it records can be trusted, start over
+            checkpoint = {'offset': 0, 'pastes': {}}
+        pastes = self.listing()
+        pending = [paste for paste in pastes
+                   if paste.key not in checkpoint['pastes']]
+        failed = {}
+
+        mode = 'r+b' if os.path.exists(self.path) else 'wb'
+        with open(self.path, mode) as archive:
+            # Drop whatever was written after the last checkpoint
+            archive.truncate(checkpoint['offset'])
+            archive.seek(checkpoint['offset'])
+            new_member = self.compression[self.compression_name]
+
+            member = new_member(archive)
+            in_member = 0
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                # Only keep a bounded window of bodies in memory
+                window = {}
+                pending.reverse()
+                while pending or window:
+                    while pending and len(window) < 2 * self.workers:
+                        paste = pending.pop()
+                        future = executor.submit(
+                            self.api.get_user_pastes_content, paste.key,
+                            self.api_user_key)
+                        window[future] = paste
+                    (done, _) = wait(window, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        paste = window.pop(future)
+                        try:
+                            content = future.result()
+                        except PastebinError as e:
+                            failed[paste.key] = e
+                            continue
+                        mtime = paste.date.timestamp()
+                        self._write_entry(member, paste.key, content, mtime)
+                        checkpoint['pastes'][paste.key] = paste.as_dict()
+                        in_member += 1
+                        if in_member >= self.checkpoint_every:
+                            self._close_member(archive, member, checkpoint)
+                            member = new_member(archive)
+                            in_member = 0
+            self._close_member(archive, member, checkpoint)
+
+            # Last member: manifest, then the end-of-archive marker
+            manifest = {
+                'account': self.account,
+                'exported': int(time.time()),
+                'pastes': [checkpoint['pastes'][paste.key]
+                           for paste in pastes
+                           if paste.key in checkpoint['pastes']],
+            }
+            member = new_member(archive)
+            self._write_entry(member, self._manifest_name,
+                              json.dumps(manifest, indent=1).encode('utf-8'),
+                              manifest['exported'])
+            member.write(tarfile.NUL * (2 * tarfile.BLOCKSIZE))
+            member.close()
+            archive.flush()
+            os.fsync(archive.fileno())
+
+        os.remove(self._checkpoint_path())
+        archived = [paste.key for paste in pastes if paste.key not in failed]
+        return {'archived': archived, 'failed': failed}
+
+
+def _archive_path(directory, account, compression):
+    """Path of the archive of an account: the one of an interrupted export,
+    whatever its date, or else a new one named after today."""
+
+    pattern = os.path.join(glob.escape(directory), '%s-*.tar.%s.checkpoint'
+                           % (glob.escape(account), compression))
+    interrupted = sorted(glob.glob(pattern))
+    if interrupted:
+        return interrupted[-1][:-len('.checkpoint')]
+    return os.path.join(directory, '%s-%s.tar.%s' % (
+        account, date.today().isoformat(), compression))
+
+
+if __name__ == "__main__":
+    from client import get_creds
+
+    parser = argparse.ArgumentParser(
+        description='Export the pastes of Pastebin accounts')
+    parser.add_argument('-c', '--config', dest='configs', action='append',
+                        help='Configuration file path, one per account')
+    parser.add_argument('-z', '--compression', dest='compression',
+                        default='gz', choices=sorted(PasteArchive.compression),
+                        help='Archive compression')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=4,
+                        help='Number of parallel downloads')
+    parser.add_argument('path', help='Directory holding the archives')
+    args = parser.parse_args()
+    if not args.configs:
+        args.configs = [os.path.join(os.getenv('HOME'), '.pbcreds')]
+
+    status = 0
+    for config in args.configs:
+        (api_dev_key, username, password) = get_creds(config)
+        archive_path = _archive_path(args.path, username, args.compression)
+        pclient = PastebinAPI(api_dev_key)
+        try:
+            pclient.generate_user_key(username, password)
+            result = PasteArchive(pclient, archive_path, username,
+                                  compression=args.compression,
+                                  workers=args.jobs).export()
+        except PastebinError as e:
+            print('[-] Pastebin export %s: %s' % (username, e))
+            status = 1
+            continue
+        print('[+] %s: %d archived, %d failed' % (
+            archive_path, len(result['archived']), len(result['failed'])))
+        for key, error in result['failed'].items():
+            print('[-] %s: %s' % (key, error))
+            status = 1
+    exit(status)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    fetchqueue.py - Expiry-aware fetch scheduling for scraped pastes.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+import heapq
+import itertools
+import threading
+import time
+
+from pastebin import \
+    PastebinAPI, \
+    PastebinError
+
+
+class FetchScheduler:
+    """Priority queue of pastes waiting for their content to be fetched.
+    Pastes are ordered by expiry date (soonest first, never-expiring pastes
+    last), then by size (smallest first), then by age (oldest first).
+
+    Re-prioritising a paste does not touch the heap: its previous entry is
+    only marked as removed, and skipped when it reaches the top.
+
+    The scheduler is safe to share between threads.
+    """
+
+    # Marker for entries which were removed or re-prioritised
+    _removed = None
+
+    def __init__(self, clock=time.time):
+        """ New FetchScheduler object.
+
+        @type   clock: callable
+        @param  clock: (Optional) Returns the current time, as a timestamp.
+        """
+
+        self.clock = clock
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self.metrics = {
+            'scheduled': 0,
+            'fetched': 0,
+            'failed': 0,
+            # Expired before their turn came
+            'missed': 0,
+            # Expired while being fetched
+            'missed_in_flight': 0,
+        }
+
+    def _timestamp(when):
+        if when is None:
+            return float('inf')
+        return when.timestamp()
+
+    def priority(paste):
+        """Compute the priority of a paste, lowest comes first.
+
+        @type   paste: Paste
+        @param  paste: The paste to prioritise.
+
+        @rtype:     tuple
+        @returns:   Expiry timestamp, size and creation timestamp.
+        """
+
+        return (FetchScheduler._timestamp(paste.expire_date),
+                paste.size or 0,
+                FetchScheduler._timestamp(paste.date))
+
+    def push(self, paste, priority=None):
+        """Schedule a paste, or re-prioritise it if already scheduled.
+
+        @type   paste: Paste
+        @param  paste: The paste to fetch.
+
+        @type   priority: tuple
+        @param  priority: (Optional) Priority overriding the default one.
+        """
+
+        if priority is None:
+            priority = FetchScheduler.priority(paste)
+        with self._lock:
+            if paste.key in self._entries:
+                self._entries.pop(paste.key)[-1] = self._removed
+            else:
+                self.metrics['scheduled'] += 1
+            entry = [priority, next(self._counter), paste]
+            self._entries[paste.key] = entry
+            heapq.heappush(self._heap, entry)
+
+    def remove(self, key):
+        """Unschedule a paste.
+
+        @type   key: string
+        @param  key: Key of the paste.
+
+        @rtype:     boolean
+        @returns:   Whether the paste was scheduled.
+        """
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            entry[-1] = self._removed
+            return True
+
+    def pop(self):
+        """Unschedule the paste to fetch next.
+        Pastes already expired are dropped and counted as missed.
+
+        @rtype:     Paste
+        @returns:   The paste to fetch next, or None if none is scheduled.
+        """
+
+        with self._lock:
+            while self._heap:
+                (priority, _, paste) = heapq.heappop(self._heap)
+                if paste is self._removed:
+                    continue
+                del self._entries[paste.key]
+                if priority[0] <= self.clock():
+                    self.metrics['missed'] += 1
+                    continue
+                return paste
+        return None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def fetch(self, paste, fetcher=PastebinAPI.scrape_get_data):
+        """Fetch the content of a paste, and account for the outcome.
+
+        @type   paste: Paste
+        @param  paste: The paste to fetch.
+
+        @type   fetcher: callable
+        @param  fetcher: (Optional) Called with the key of the paste, returns
+        its content.
+
+        @rtype:     bytes
+        @returns:   The content, or None if it could not be fetched.
+        """
+
+        try:
+            content = fetcher(paste.key)
+        except PastebinError:
+            with self._lock:
+                if FetchScheduler._timestamp(paste.expire_date) \
+                        <= self.clock():
+                    self.metrics['missed_in_flight'] += 1
+                else:
+                    self.metrics['failed'] += 1
+            return None
+        with self._lock:
+            self.metrics['fetched'] += 1
+        return content
+
+    def drain(self, fetcher=PastebinAPI.scrape_get_data):
+        """Fetch every scheduled paste, most urgent first.
+        Can be called from several threads at once.
+
+        @type   fetcher: callable
+        @param  fetcher: (Optional) Called with the key of a paste, returns
+        its content.
+
+        @rtype:     generator
+        @returns:   Tuples of fetched pastes and their content.
+        """
+
+        while True:
+            paste = self.pop()
+            if paste is None:
+                return
+            content = self.fetch(paste, fetcher)
+            if content is not None:
+                yield (paste, content)
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    gateway.py - Shared caching HTTP gateway to the Pastebin API.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+import argparse
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+from pastebin import \
+    CircuitOpenError, \
+    InvalidKeyError, \
+    InvalidRequestError, \
+    PastebinAPI, \
+    PastebinError, \
+    PasteNotFoundError, \
+    PermissionDeniedError, \
+    RateLimiter, \
+    ScrapingAccessError, \
+    ThrottledError, \
+    UnavailableError
+
+
+class ResponseCache:
+    """Bounded cache of upstream responses, each with its own lifetime.
+    Concurrent requests for a missing entry are merged: only the first one
+    calls upstream, the others wait for its result.
+
+    The cache is bounded both in entries and in bytes of the cached values;
+    values larger than C{max_entry_bytes} are not cached at all.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 << 20,
+                 max_entry_bytes=1 << 20, clock=time.monotonic):
+        """ New ResponseCache object.
+
+        @type   max_entries: int
+        @param  max_entries: (Optional) Number of entries kept, the least
+        recently used ones are evicted first.
+
+        @type   max_bytes: int
+        @param  max_bytes: (Optional) Total size of the values kept.
+
+        @type   max_entry_bytes: int
+        @param  max_entry_bytes: (Optional) Size above which a value is not
+        cached.
+
+        @type   clock: callable
+        @param  clock: (Optional) Returns the current time, in seconds.
+        """
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.clock = clock
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl, load):
+        """Get an entry, loading it if missing or expired.
+
+        @type   key: tuple
+        @param  key: Key of the entry.
+
+        @type   ttl: float
+        @param  ttl: Lifetime of a loaded entry, in seconds. Not cached if 0.
+
+        @type   load: callable
+        @param  load: Called without arguments, returns the value.
+
+        @rtype:     tuple
+        @returns:   The value, and how it was obtained: C{'hit'}, C{'merged'}
+        (waited for a concurrent load) or C{'miss'}.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                return (entry[1], 'hit')
+            future = self._in_flight.get(key)
+            if future is not None:
+                outcome = 'merged'
+            else:
+                outcome = 'miss'
+                future = self._in_flight[key] = Future()
+        if outcome == 'merged':
+            return (future.result(), outcome)
+
+        try:
+            value = load()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        size = 0 if value is None else len(value)
+        with self._lock:
+            del self._in_flight[key]
+            if ttl > 0 and size <= self.max_entry_bytes:
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self.bytes -= previous[2]
+                self._entries[key] = (self.clock() + ttl, value, size)
+                self.bytes += size
+                while len(self._entries) > self.max_entries \
+                        or self.bytes > self.max_bytes:
+                    (_, evicted) = self._entries.popitem(last=False)
+                    self.bytes -= evicted[2]
+        future.set_result(value)
+        return (value, outcome)
+
+
+class PastebinGateway:
+    """Local HTTP gateway sharing one PastebinAPI between many services.
+
+    Services call the gateway instead of Pastebin, and share its response
+    cache, its merging of identical requests and its global rate budget.
+    Usage is accounted per client, named by the C{X-Client} header or else
+    by address.
+
+    Routes, answered with the raw upstream response:
+        - C{POST /paste}: form fields content, title, format, guest (0 or
+          1), type and expire; returns the URL of the paste.
+        - C{GET /list?limit=&user_key=}: pastes of an account, as XML.
+        - C{GET /trending}: trending pastes, as XML.
+        - C{GET /raw/<key>}: content of a paste, through the raw API.
+        - C{GET /scrape/recent?limit=&lang=}: recent pastes, as JSON.
+        - C{GET /scrape/item/<key>}: content of a paste, through scraping.
+        - C{GET /scrape/meta/<key>}: metadata of a paste, as JSON.
+        - C{GET /stats}: usage per client, as JSON.
+
+    urllib opens one upstream connection per request; sharing the gateway
+    bounds the number of concurrent upstream requests instead.
+    """
+
+    # Default lifetime of cached responses, in seconds, by operation
+    cache_ttls = {
+        'list': 30,
+        'trending': 60,
+        'raw': 300,
+        'scrape_recent': 5,
+        'scrape_item': 300,
+        'scrape_meta': 60,
+    }
+
+    # HTTP status of the API errors, most specific first
+    _error_status = (
+        (CircuitOpenError, 503),
+        (PasteNotFoundError, 404),
+        (ThrottledError, 429),
+        (ScrapingAccessError, 403),
+        (PermissionDeniedError, 403),
+        (InvalidKeyError, 401),
+        (InvalidRequestError, 400),
+        (UnavailableError, 502),
+        (PastebinError, 500),
+    )
+
+    def __init__(self, api, address=('127.0.0.1', 8080), rate=1.0, burst=5,
+                 max_upstream=4, cache_ttls=None, max_cache_entries=10000,
+                 max_cache_bytes=64 << 20, max_cached_body=1 << 20):
+        """ New PastebinGateway object.
+
+        @type   api: PastebinAPI
+        @param  api: The shared client.
+
+        @type   address: tuple
+        @param  address: (Optional) (host, port) to listen on.
+
+        @type   rate: float
+        @param  rate: (Optional) Upstream requests allowed per second.
+
+        @type   burst: int
+        @param  burst: (Optional) Upstream requests allowed at once after a
+        quiet period.
+
+        @type   max_upstream: int
+        @param  max_upstream: (Optional) Maximum concurrent upstream
+        requests.
+
+        @type   cache_ttls: dict
+        @param  cache_ttls: (Optional) Lifetimes overriding the defaults,
+        by operation.
+
+        @type   max_cache_entries: int
+        @param  max_cache_entries: (Optional) Number of entries of the
+        response cache.
+
+        @type   max_cache_bytes: int
+        @param  max_cache_bytes: (Optional) Size of the response cache, in
+        bytes.
+
+        @type   max_cached_body: int
+        @param  max_cached_body: (Optional) Size of the largest response
+        cached, in bytes.
+        """
+
+        self.api = api
+        self.address = address
+        self.limiter = RateLimiter(rate, burst)
+        self.cache = ResponseCache(max_cache_entries, max_cache_bytes,
+                                   max_cached_body)
+        self.cache_ttls = dict(self.cache_ttls)
+        if cache_ttls is not None:
+            self.cache_ttls.update(cache_ttls)
+        self.usage = {}
+        self._upstream = threading.BoundedSemaphore(max_upstream)
+        self._usage_lock = threading.Lock()
+        self._server = None
+
+    def _account(self, client, outcome=None, error=False, size=0):
+        with self._usage_lock:
+            usage = self.usage.setdefault(client, {
+                'requests': 0, 'hits': 0, 'merged': 0, 'upstream': 0,
+                'errors': 0, 'bytes': 0})
+            usage['requests'] += 1
+            if outcome == 'hit':
+                usage['hits'] += 1
+            elif outcome == 'merged':
+                usage['merged'] += 1
+            elif outcome == 'miss':
+                usage['upstream'] += 1
+            if error:
+                usage['errors'] += 1
+            usage['bytes'] += size
+
+    def _call(self, operation, *args):
+        self.limiter.acquire()
+        with self._upstream:
+            return operation(*args)
+
+    def _cached(self, name, key, operation, *args):
+        return self.cache.get((name,) + key, self.cache_ttls[name],
+                              lambda: self._call(operation, *args))
+
+    def get(self, path, query):
+        """Answer a GET request.
+
+        @type   path: string
+        @param  path: Path of the request.
+
+        @type   query: dict
+        @param  query: Query parameters, as returned by parse_qs.
+
+        @rtype:     tuple
+        @returns:   The response body, its content type and how it was
+        obtained (see L{ResponseCache.get}), or None if the path is unknown.
+        """
+
+        parts = path.strip('/').split('/')
+        param = lambda name: query.get(name, [None])[0]
+        if parts == ['list']:
+            limit = int(param('limit') or 50)
+            user_key = param('user_key')
+            (body, outcome) = self._cached(
+                'list', (user_key, limit), self.api.list_user_pastes_mdata,
+                user_key, limit)
+            return (body or b'', 'text/xml', outcome)
+        if parts == ['trending']:
+            (body, outcome) = self._cached('trending', (),
+                                           self.api.trending)
+            return (body, 'text/xml', outcome)
+        if len(parts) == 2 and parts[0] == 'raw':
+            (body, outcome) = self._cached('raw', (parts[1],),
+                                           PastebinAPI.get_paste, parts[1])
+            return (body, 'text/plain', outcome)
+        if parts == ['scrape', 'recent']:
+            limit = int(param('limit') or 0)
+            lang = param('lang')
+            (body, outcome) = self._cached(
+                'scrape_recent', (limit, lang),
+                PastebinAPI.scrape_recents_pastes, limit, lang)
+            return (body, 'application/json', outcome)
+        if len(parts) == 3 and parts[:2] == ['scrape', 'item']:
+            (body, outcome) = self._cached(
+                'scrape_item', (parts[2],), PastebinAPI.scrape_get_data,
+                parts[2])
+            return (body, 'text/plain', outcome)
+        if len(parts) == 3 and parts[:2] == ['scrape', 'meta']:
+            (body, outcome) = self._cached(
+                'scrape_meta', (parts[2],), PastebinAPI.scrape_get_metadata,
+                parts[2])
+            return (body, 'application/json', outcome)
+        return None
+
+    def post(self, path, form):
+        """Answer a POST request.
+
+        @type   path: string
+        @param  path: Path of the request.
+
+        @type   form: dict
+        @param  form: Form fields, as returned by parse_qs.
+
+        @rtype:     tuple
+        @returns:   The response body, its content type and C{'miss'}, or
+        None if the path is unknown.
+        """
+
+        if path.strip('/') != 'paste':
+            return None
+        field = lambda name, default=None: form.get(name, [default])[0]
+        url = self._call(self.api.paste, field('content', ''),
+                         field('title'), field('format'),
+                         field('guest', '1') != '0', field('type', 'public'),
+                         field('expire', 'N'))
+        return (url.encode('utf-8'), 'text/plain', 'miss')
+
+    def status(self, e):
+        """HTTP status of an API error.
+
+        @type   e: PastebinError
+        @param  e: The error.
+
+        @rtype:     int
+        @returns:   The HTTP status code.
+        """
+
+        for (error_type, status) in self._error_status:
+            if isinstance(e, error_type):
+                return status
+        return 500
+
+    def start(self):
+        """Start serving in a background thread."""
+
+        self._server = ThreadingHTTPServer(self.address, _GatewayHandler)
+        self._server.daemon_threads = True
+        self._server.gateway = self
+        self.address = self._server.server_address
+        thread = threading.Thread(target=self._server.serve_forever,
+                                  daemon=True)
+        thread.start()
+
+    def stop(self):
+        """Stop serving."""
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class _GatewayHandler(BaseHTTPRequestHandler):
+
+    def _client(self):
+        return self.headers.get('X-Client') or self.client_address[0]
+
+    def _reply(self, status, body, content_type='text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _serve(self, answer):
+        gateway = self.server.gateway
+        client = self._client()
+        try:
+            result = answer()
+        except PastebinError as e:
+            gateway._account(client, error=True)
+            self._reply(gateway.status(e), str(e).encode('utf-8'))
+            return
+        except ValueError as e:
+            gateway._account(client, error=True)
+            self._reply(400, str(e).encode('utf-8'))
+            return
+        if result is None:
+            gateway._account(client, error=True)
+            self._reply(404, b'Unknown route')
+            return
+        (body, content_type, outcome) = result
+        gateway._account(client, outcome, size=len(body))
+        self._reply(200, body, content_type)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/stats':
+            with self.server.gateway._usage_lock:
+                body = json.dumps(self.server.gateway.usage, indent=1)
+            self._reply(200, body.encode('utf-8'), 'application/json')
+            return
+        query = urllib.parse.parse_qs(url.query)
+        self._serve(lambda: self.server.gateway.get(url.path, query))
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        form = urllib.parse.parse_qs(
+            str(self.rfile.read(length), 'utf-8', 'replace'))
+        self._serve(lambda: self.server.gateway.post(url.path, form))
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    from client import get_creds
+
+    parser = argparse.ArgumentParser(
+        description='Serve the Pastebin API to local services')
+    parser.add_argument('-c', '--config', dest='config',
+                        default=os.path.join(os.getenv('HOME'), '.pbcreds'),
+                        help='Configuration file path')
+    parser.add_argument('-l', '--listen', dest='listen',
+                        default='127.0.0.1:8080',
+                        help='host:port to listen on')
+    parser.add_argument('-r', '--rate', dest='rate', type=float, default=1.0,
+                        help='Upstream requests per second')
+    args = parser.parse_args()
+
+    (api_dev_key, username, password) = get_creds(args.config)
+    pclient = PastebinAPI(api_dev_key)
+    try:
+        pclient.generate_user_key(username, password)
+    except PastebinError as e:
+        print('[-] Pastebin get user key: %s' % e)
+    (host, port) = args.listen.rsplit(':', 1)
+    gateway = PastebinGateway(pclient, (host, int(port)), rate=args.rate)
+    gateway.start()
+    print('[+] Listening on %s:%d' % gateway.address)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        gateway.stop()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    hedge.py - Hedged paste content fetches.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import threading
+import time
+
+from pastebin import \
+    PastebinAPI, \
+    PastebinError
+
+
+class HedgedFetcher:
+    """Fetch of paste contents racing the raw and scraping endpoints.
+
+    The preferred endpoint is called first. If it has not answered after a
+    delay, taken as a percentile of its recent latencies, the other endpoint
+    is called as well, and the first content received is returned. If the
+    preferred endpoint fails before the delay, the other one is called at
+    once.
+
+    Each endpoint has its own worker threads, so that backup requests do not
+    queue behind stalled preferred ones. A blocking urlopen() cannot be
+    interrupted: the losing request is cancelled if it has not started yet,
+    otherwise its result is discarded, and it ends at the latest after the
+    request timeout.
+    """
+
+    # Endpoints returning the content of a paste from its key
+    endpoints = {
+        'raw': PastebinAPI.get_paste,
+        'scrape': PastebinAPI.scrape_get_data,
+    }
+
+    def __init__(self, preferred='scrape', percentile=95, min_delay=0.05,
+                 max_delay=2.0, window=200, workers=8, timeout=30,
+                 clock=time.monotonic):
+        """ New HedgedFetcher object.
+
+        @type   preferred: string
+        @param  preferred: (Optional) Endpoint to call first, C{'raw'} or
+        C{'scrape'}.
+
+        @type   percentile: float
+        @param  percentile: (Optional) Percentile of the preferred endpoint
+        latencies after which the backup request is sent.
+
+        @type   min_delay: float
+        @param  min_delay: (Optional) Lower bound of the delay, in seconds.
+
+        @type   max_delay: float
+        @param  max_delay: (Optional) Upper bound of the delay, in seconds.
+        Also the delay used until enough latencies were measured.
+
+        @type   window: int
+        @param  window: (Optional) Number of latencies kept per endpoint.
+
+        @type   workers: int
+        @param  workers: (Optional) Number of concurrent requests per
+        endpoint.
+
+        @type   timeout: float
+        @param  timeout: (Optional) Seconds after which a request to an
+        endpoint fails.
+
+        @type   clock: callable
+        @param  clock: (Optional) Returns the current time, in seconds.
+        """
+
+        if preferred not in self.endpoints:
+            raise ValueError('Unknown endpoint: %s' % preferred)
+        self.preferred = preferred
+        self.backup = [name for name in self.endpoints
+                       if name != preferred][0]
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.clock = clock
+        self._latencies = dict((name, deque(maxlen=window))
+                               for name in self.endpoints)
+        self._lock = threading.Lock()
+        self._executors = dict((name, ThreadPoolExecutor(max_workers=workers))
+                               for name in self.endpoints)
+        self.stats = {
+            'requests': 0,
+            # Backup requests sent because the preferred one was slow
+            'hedged': 0,
+            # Hedged requests where the backup answered first, even after a
+            # failure of the preferred one
+            'hedge_won': 0,
+            # Backup requests sent because the preferred one failed
+            'failovers': 0,
+            'errors': 0,
+        }
+
+    def delay(self):
+        """Compute the current hedging delay.
+
+        @rtype:     float
+        @returns:   Seconds to wait for the preferred endpoint.
+        """
+
+        with self._lock:
+            latencies = sorted(self._latencies[self.preferred])
+        if len(latencies) < 10:
+            return self.max_delay
+        index = min(len(latencies) - 1,
+                    int(len(latencies) * self.percentile / 100))
+        return min(self.max_delay, max(self.min_delay, latencies[index]))
+
+    def _call(self, name, key):
+        # Only successful calls are measured: failures may be fast or hit the
+        # timeout, and say nothing of the usual latency
+        started = self.clock()
+        content = self.endpoints[name](key, timeout=self.timeout)
+        with self._lock:
+            self._latencies[name].append(self.clock() - started)
+        return content
+
+    def _submit(self, name, key):
+        return self._executors[name].submit(self._call, name, key)
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def fetch(self, key):
+        """Fetch the content of a paste.
+
+        @type   key: string
+        @param  key: The unique key for the paste.
+
+        @rtype:     bytes
+        @returns:   The content of the paste.
+        """
+
+        self._count('requests')
+        deadline = self.clock() + self.delay()
+        futures = {self._submit(self.preferred, key): self.preferred}
+        backup_sent = False
+        hedged = False
+        error = None
+        while futures:
+            timeout = None
+            if not backup_sent:
+                timeout = max(0, deadline - self.clock())
+            (done, _) = wait(futures, timeout=timeout,
+                             return_when=FIRST_COMPLETED)
+            if not done:
+                futures[self._submit(self.backup, key)] = self.backup
+                backup_sent = True
+                hedged = True
+                self._count('hedged')
+                continue
+            for future in done:
+                name = futures.pop(future)
+                try:
+                    content = future.result()
+                except (PastebinError, OSError) as e:
+                    error = e
+                    if not backup_sent:
+                        futures[self._submit(self.backup, key)] = self.backup
+                        backup_sent = True
+                        self._count('failovers')
+                    continue
+                for loser in futures:
+                    loser.cancel()
+                if name == self.backup and hedged:
+                    self._count('hedge_won')
+                return content
+        self._count('errors')
+        raise error
+
+    def close(self):
+        """Release the worker threads, once pending requests are done."""
+
+        for executor in self._executors.values():
+            executor.shutdown(wait=False)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    keypool.py - Load spreading over several Pastebin accounts.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+import itertools
+import threading
+import time
+
+from pastebin import \
+    CircuitOpenError, \
+    PastebinAPI, \
+    PastebinError, \
+    ThrottledError
+
+
+class Identity:
+    """Pastebin account of a pool: a developer key and a user key, with
+    its usage counters.
+    """
+
+    def __init__(self, name, api_dev_key, api_user_key=None, quota=None):
+        """ New Identity object.
+
+        @type   name: string
+        @param  name: Name of the account, used to pin calls to it.
+
+        @type   api_dev_key: string
+        @param  api_dev_key: The API Developer key of the account.
+
+        @type   api_user_key: string
+        @param  api_user_key: (Optional) The API User key of the account.
+
+        @type   quota: int
+        @param  quota: (Optional) Maximum number of calls per quota window.
+        Unlimited if not provided.
+        """
+
+        self.name = name
+        self.api = PastebinAPI(api_dev_key, api_user_key)
+        self.quota = quota
+        self.used = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.window_start = None
+        self.cooldown_until = 0
+
+    def __str__(self):
+        return 'Identity: name %s requests %d in flight %d errors %d \
+throttled %d quota used %d/%s' % (
+            self.name, self.requests, self.in_flight, self.errors,
+            self.throttled, self.used, self.quota)
+
+
+class PastebinAPIPool:
+    """PastebinAPI spreading calls over several identities.
+
+    Calls go to the least loaded identity (fewest calls in flight, then
+    fewest calls overall) or round-robin. An identity being throttled is
+    set aside for a cool-down, and one having used its quota is set aside
+    until its quota window is over. Each identity has its own circuit
+    breakers: a call refused by an open circuit sets the identity aside
+    until the circuit may be probed again. Calls refused by a throttled or
+    open identity were not accepted upstream, and are retried on another
+    identity, unless pinned to an account.
+
+    Calls tied to an account, such as deleting one of its pastes, are sent
+    to that account by passing its name as C{account}.
+    """
+
+    strategies = ('least-loaded', 'round-robin')
+
+    def __init__(self, identities=(), strategy='least-loaded', cooldown=60,
+                 quota_window=86400, clock=time.monotonic):
+        """ New PastebinAPIPool object.
+
+        @type   identities: iterable
+        @param  identities: (Optional) Identity objects of the pool.
+
+        @type   strategy: string
+        @param  strategy: (Optional) C{'least-loaded'} or C{'round-robin'}.
+
+        @type   cooldown: float
+        @param  cooldown: (Optional) Seconds a throttled identity is set
+        aside.
+
+        @type   quota_window: float
+        @param  quota_window: (Optional) Seconds after which quotas are
+        reset.
+
+        @type   clock: callable
+        @param  clock: (Optional) Returns the current time, in seconds.
+        """
+
+        if strategy not in self.strategies:
+            raise ValueError('Unknown strategy: %s' % strategy)
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.quota_window = quota_window
+        self.clock = clock
+        self.identities = {}
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        for identity in identities:
+            self.add(identity)
+
+    def add(self, identity):
+        """Add an identity to the pool.
+
+        @type   identity: Identity
+        @param  identity: The identity to add.
+        """
+
+        with self._lock:
+            self.identities[identity.name] = identity
+
+    def _available(self, identity, now):
+        if identity.cooldown_until > now:
+            return False
+        if identity.quota is None:
+            return True
+        if identity.window_start is None \
+                or now - identity.window_start >= self.quota_window:
+            identity.window_start = now
+            identity.used = 0
+        return identity.used < identity.quota
+
+    def _acquire(self, account, excluded=()):
+        with self._lock:
+            now = self.clock()
+            if account is not None:
+                if account not in self.identities:
+                    raise PastebinError('Unknown account: %s' % account)
+                candidates = [self.identities[account]]
+            else:
+                candidates = list(self.identities.values())
+            candidates = [identity for identity in candidates
+                          if identity.name not in excluded
+                          and self._available(identity, now)]
+            if not candidates:
+                raise ThrottledError('No identity available for %s' % (
+                    account or 'the pool'))
+            if self.strategy == 'round-robin':
+                identity = candidates[next(self._round_robin)
+                                      % len(candidates)]
+            else:
+                identity = min(candidates, key=lambda identity: (
+                    identity.in_flight, identity.requests))
+            identity.in_flight += 1
+            identity.requests += 1
+            identity.used += 1
+            return identity
+
+    def _call(self, operation, account, *args, **kwargs):
+        excluded = set()
+        while True:
+            identity = self._acquire(account, excluded)
+            try:
+                return self._call_identity(identity, operation, *args,
+                                           **kwargs)
+            except (CircuitOpenError, ThrottledError):
+                if account is not None:
+                    raise
+                excluded.add(identity.name)
+
+    def _call_identity(self, identity, operation, *args, **kwargs):
+        try:
+            return getattr(identity.api, operation)(*args, **kwargs)
+        except CircuitOpenError as e:
+            # Nothing was sent: set the identity aside until its circuit
+            # may be probed
+            with self._lock:
+                identity.requests -= 1
+                identity.used -= 1
+                identity.cooldown_until = max(identity.cooldown_until,
+                                              self.clock() + e.retry_after)
+            raise
+        except PastebinError as e:
+            with self._lock:
+                identity.errors += 1
+                if isinstance(e, ThrottledError):
+                    identity.throttled += 1
+                    identity.cooldown_until = self.clock() + self.cooldown
+            raise
+        finally:
+            with self._lock:
+                identity.in_flight -= 1
+
+    def paste(self, paste_content, paste_title=None, paste_format=None,
+              paste_guest=True, paste_type='public', paste_expire_date='N',
+              account=None):
+        """Submit a code snippet to Pastebin.
+        See L{PastebinAPI.paste}; pass C{account} to post under a given
+        account, which is required unless posting as a guest.
+        """
+
+        if not paste_guest and account is None:
+            raise ValueError('Pass the account to post a paste under')
+        return self._call('paste', account, paste_content, paste_title,
+                          paste_format, paste_guest, paste_type,
+                          paste_expire_date)
+
+    def list_user_pastes_mdata(self, results_limit=None, account=None):
+        """Returns all pastes of an account.
+        See L{PastebinAPI.list_user_pastes_mdata}. Without C{account}, the
+        pastes of whichever identity serves the call are returned.
+        """
+
+        return self._call('list_user_pastes_mdata', account, None,
+                          results_limit)
+
+    def trending(self):
+        """Returns the top trending paste details.
+        See L{PastebinAPI.trending}.
+        """
+
+        return self._call('trending', None)
+
+    def delete_paste(self, paste_key, account):
+        """Delete a paste of an account.
+        See L{PastebinAPI.delete_paste}.
+        """
+
+        return self._call('delete_paste', account, paste_key)
+
+    def user_details(self, account=None):
+        """Return the details of an account.
+        See L{PastebinAPI.user_details}. Without C{account}, the details of
+        whichever identity serves the call are returned.
+        """
+
+        return self._call('user_details', account)
+
+    def get_user_pastes_content(self, paste_key, account):
+        """Returns the content of a paste of an account.
+        See L{PastebinAPI.get_user_pastes_content}.
+        """
+
+        return self._call('get_user_pastes_content', account, paste_key)
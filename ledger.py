@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    ledger.py - Deduplication of uploads by content hash.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+import hashlib
+import sqlite3
+import time
+
+
+class UploadLedger:
+    """Ledger of uploaded pastes, by hash of their content and settings.
+
+    paste() returns the URL of a live paste with the same content, title,
+    format, type and account if there is one, and uploads it otherwise.
+    Entries expire along with their paste.
+
+    The ledger is an SQLite database, which can be shared by several
+    processes. While a process uploads a paste, its entry is marked as
+    pending, and the other processes wait for its URL rather than uploading
+    the same paste.
+    """
+
+    # Lifetime of pastes in seconds, by paste_expire_date, rounded down
+    lifetimes = {
+        'N': None,
+        '10M': 600,
+        '1H': 3600,
+        '1D': 86400,
+        '1W': 7 * 86400,
+        '2W': 14 * 86400,
+        '1M': 28 * 86400,
+        '6M': 181 * 86400,
+        '1Y': 365 * 86400,
+    }
+
+    _schema = '''CREATE TABLE IF NOT EXISTS uploads (
+        hash TEXT PRIMARY KEY,
+        url TEXT,
+        created REAL NOT NULL,
+        expires REAL
+    )'''
+
+    def __init__(self, path, api, pending_timeout=60, poll_interval=0.2,
+                 clock=time.time, sleep=time.sleep):
+        """ New UploadLedger object.
+
+        @type   path: string
+        @param  path: Path of the SQLite database.
+
+        @type   api: PastebinAPI
+        @param  api: Client used to upload the pastes.
+
+        @type   pending_timeout: float
+        @param  pending_timeout: (Optional) Seconds after which a pending
+        upload is considered abandoned.
+
+        @type   poll_interval: float
+        @param  poll_interval: (Optional) Seconds between two checks of a
+        pending upload.
+
+        @type   clock: callable
+        @param  clock: (Optional) Returns the current time, as a timestamp.
+
+        @type   sleep: callable
+        @param  sleep: (Optional) Waits for a number of seconds.
+        """
+
+        self.path = path
+        self.api = api
+        self.pending_timeout = pending_timeout
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = {'hits': 0, 'uploads': 0, 'waits': 0}
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(self._schema)
+
+    def _connect(self):
+        # Autocommit mode: transactions are explicit BEGIN IMMEDIATE
+        return _Connection(sqlite3.connect(self.path, timeout=30,
+                                           isolation_level=None))
+
+    def digest(self, paste_content, paste_title, paste_format, paste_guest,
+               paste_type):
+        """Hash a paste with its settings and account.
+
+        @rtype:     string
+        @returns:   Hexadecimal SHA-256 digest.
+        """
+
+        account = 'guest:%s' % self.api.api_dev_key
+        if not paste_guest:
+            account = 'user:%s:%s' % (self.api.api_dev_key,
+                                      self.api.api_user_key)
+        digest = hashlib.sha256()
+        for field in (account, paste_title, paste_format, paste_type):
+            digest.update(repr(field).encode('utf-8'))
+            digest.update(b'\0')
+        if isinstance(paste_content, str):
+            paste_content = paste_content.encode('utf-8')
+        digest.update(paste_content)
+        return digest.hexdigest()
+
+    def _reserve(self, connection, digest):
+        # Returns the URL of a live paste, or None once reserved for us
+        while True:
+            now = self.clock()
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                'SELECT url, created, expires FROM uploads WHERE hash = ?',
+                (digest,)).fetchone()
+            if row is not None:
+                (url, created, expires) = row
+                if url is not None and (expires is None or expires > now):
+                    connection.execute('COMMIT')
+                    return url
+                if url is None and now - created < self.pending_timeout:
+                    # Another process is uploading it
+                    connection.execute('COMMIT')
+                    self.stats['waits'] += 1
+                    self.sleep(self.poll_interval)
+                    continue
+            connection.execute(
+                'INSERT OR REPLACE INTO uploads VALUES (?, NULL, ?, NULL)',
+                (digest, now))
+            connection.execute('COMMIT')
+            return None
+
+    def paste(self, paste_content, paste_title=None, paste_format=None,
+              paste_guest=True, paste_type='public', paste_expire_date='N'):
+        """Submit a code snippet to Pastebin, unless already submitted.
+        See L{PastebinAPI.paste}.
+
+        @rtype:  string
+        @return: Returns the URL of the new or existing paste.
+        """
+
+        digest = self.digest(paste_content, paste_title, paste_format,
+                             paste_guest, paste_type)
+        expire = str(paste_expire_date or 'N').strip().upper()
+        with self._connect() as connection:
+            url = self._reserve(connection, digest)
+            if url is not None:
+                self.stats['hits'] += 1
+                return url
+            try:
+                created = self.clock()
+                url = self.api.paste(paste_content, paste_title,
+                                     paste_format, paste_guest, paste_type,
+                                     paste_expire_date)
+            except BaseException:
+                connection.execute('DELETE FROM uploads WHERE hash = ? \
+AND url IS NULL', (digest,))
+                raise
+            lifetime = self.lifetimes.get(expire)
+            expires = None if lifetime is None else created + lifetime
+            connection.execute(
+                'UPDATE uploads SET url = ?, created = ?, expires = ? \
+WHERE hash = ?', (url, created, expires, digest))
+            self.stats['uploads'] += 1
+            return url
+
+    def forget(self, url):
+        """Drop the entries of a paste, e.g. once deleted.
+
+        @type   url: string
+        @param  url: URL of the paste.
+
+        @rtype:     int
+        @returns:   Number of entries dropped.
+        """
+
+        with self._connect() as connection:
+            return connection.execute('DELETE FROM uploads WHERE url = ?',
+                                      (url,)).rowcount
+
+    def purge(self):
+        """Drop the entries of expired pastes.
+
+        @rtype:     int
+        @returns:   Number of entries dropped.
+        """
+
+        with self._connect() as connection:
+            return connection.execute(
+                'DELETE FROM uploads WHERE expires IS NOT NULL \
+AND expires <= ?', (self.clock(),)).rowcount
+
+
+class _Connection:
+    """Context manager closing an SQLite connection."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, *exc_info):
+        if self.connection.in_transaction:
+            self.connection.execute('ROLLBACK')
+        self.connection.close()
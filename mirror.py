@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    mirror.py - Incremental local mirror of a Pastebin account.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import threading
+
+from pastebin import \
+    PastebinAPI, \
+    PastebinError, \
+    PastesParserXML
+
+
+class PasteMirror:
+    """Incremental mirror of a user's pastes into a local directory.
+    Each paste is stored in a file named after its key. A state file records
+    the size and date of every mirrored paste; it is rewritten after each
+    download, so an interrupted sync resumes where it stopped.
+    """
+
+    # Name of the state file, stored in the mirror directory
+    _state_name = '.mirror-state.json'
+
+    def __init__(self, api, path, api_user_key=None, workers=4,
+                 results_limit=1000):
+        """ New PasteMirror object.
+
+        @type   api: PastebinAPI
+        @param  api: Client used to list and download the pastes.
+
+        @type   path: string
+        @param  path: Directory holding the mirrored pastes.
+
+        @type   api_user_key: string
+        @param  api_user_key: (Optional) The API User key of the mirrored
+        account. If not provided, the key of the client will be used.
+
+        @type   workers: int
+        @param  workers: (Optional) Number of parallel downloads.
+
+        @type   results_limit: int
+        @param  results_limit: (Optional) Number of pastes to list (1-1000).
+        """
+
+        self.api = api
+        self.path = path
+        self.api_user_key = api_user_key
+        self.workers = workers
+        self.results_limit = results_limit
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _state_path(self):
+        return os.path.join(self.path, self._state_name)
+
+    def _paste_path(self, key):
+        # Keys come from the server, never let one escape the mirror
+        return os.path.join(self.path, os.path.basename(key))
+
+    def _load_state(self):
+        try:
+            with open(self._state_path(), 'r') as state_file:
+                state = json.load(state_file)
+        except FileNotFoundError:
+            state = {}
+        state.setdefault('pastes', {})
+        return state
+
+    def _save_state(self):
+        # Write then rename, so a crash never leaves a truncated state
+        tmp_path = '%s.tmp' % self._state_path()
+        with open(tmp_path, 'w') as state_file:
+            json.dump(self._state, state_file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self._state_path())
+
+    def _write_paste(self, key, content):
+        tmp_path = '%s.tmp' % self._paste_path(key)
+        with open(tmp_path, 'wb') as paste_file:
+            paste_file.write(content)
+        os.replace(tmp_path, self._paste_path(key))
+
+    def _fetch(self, paste):
+        content = self.api.get_user_pastes_content(paste.key,
+                                                   self.api_user_key)
+        self._write_paste(paste.key, content)
+
+        # Checkpoint: the paste is only recorded once its file exists
+        with self._lock:
+            self._state['pastes'][paste.key] = PasteMirror._entry(paste)
+            self._save_state()
+
+    def _entry(paste):
+        return {'size': paste.size, 'date': str(paste.date)}
+
+    def listing(self):
+        """Fetch and parse the current listing of the account.
+
+        @rtype:     array
+        @returns:   Array of Paste objects.
+        """
+
+        pastes = PastesParserXML.parse(
+            self.api.list_user_pastes_mdata(self.api_user_key,
+                                            self.results_limit))
+        if not isinstance(pastes, list):
+            pastes = [pastes]
+        return pastes
+
+    def truncated(self, pastes):
+        """Tell whether a listing may be missing pastes of the account: the
+        API returns at most C{results_limit} pastes (up to 1000).
+
+        @type   pastes: array
+        @param  pastes: Array of Paste objects, as returned by L{listing}.
+
+        @rtype:     boolean
+        @returns:   Whether the listing is full, hence maybe incomplete.
+        """
+
+        limit = 50 if self.results_limit is None else self.results_limit
+        return len(pastes) >= min(1000, max(1, limit))
+
+    def diff(self, pastes):
+        """Compare a listing against the state of the mirror.
+        Nothing is removed after a truncated listing: mirrored pastes
+        missing from it may still exist.
+
+        @type   pastes: array
+        @param  pastes: Array of Paste objects, as returned by L{listing}.
+
+        @rtype:     tuple
+        @returns:   Pastes to download (new or changed) and keys to remove.
+        """
+
+        if self._state is None:
+            self._state = self._load_state()
+        known = self._state['pastes']
+        fetch = [paste for paste in pastes
+                 if known.get(paste.key) != PasteMirror._entry(paste)
+                 or not os.path.exists(self._paste_path(paste.key))]
+        if self.truncated(pastes):
+            return (fetch, [])
+        listed = set(paste.key for paste in pastes)
+        removed = [key for key in known if key not in listed]
+        return (fetch, removed)
+
+    def sync(self):
+        """Synchronise the mirror with the account.
+        New and changed pastes are downloaded in parallel, pastes which are
+        gone from the account are deleted locally, unless the listing was
+        truncated.
+
+        @rtype:     dict
+        @returns:   Keys of the 'fetched' and 'removed' pastes, a 'failed'
+        mapping of keys to the error met while downloading or writing them,
+        and whether the listing was 'truncated'.
+        """
+
+        os.makedirs(self.path, exist_ok=True)
+        self._state = self._load_state()
+        pastes = self.listing()
+        (fetch, removed) = self.diff(pastes)
+
+        for key in removed:
+            try:
+                os.remove(self._paste_path(key))
+            except FileNotFoundError:
+                pass
+            del self._state['pastes'][key]
+        self._save_state()
+
+        result = {'fetched': [], 'removed': removed, 'failed': {},
+                  'truncated': self.truncated(pastes)}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = dict((executor.submit(self._fetch, paste), paste.key)
+                           for paste in fetch)
+            for future, key in futures.items():
+                try:
+                    future.result()
+                    result['fetched'].append(key)
+                except (PastebinError, OSError) as e:
+                    result['failed'][key] = e
+        return result
+
+
+if __name__ == "__main__":
+    from client import get_creds
+
+    parser = argparse.ArgumentParser(
+        description='Mirror the pastes of a Pastebin account')
+    parser.add_argument('-c', '--config', dest='config',
+                        default=os.path.join(os.getenv('HOME'), '.pbcreds'),
+                        help='Configuration file path')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=4,
+                        help='Number of parallel downloads')
+    parser.add_argument('path', help='Mirror directory')
+    args = parser.parse_args()
+
+    (api_dev_key, username, password) = get_creds(args.config)
+
+    pclient = PastebinAPI(api_dev_key)
+    try:
+        pclient.generate_user_key(username, password)
+        result = PasteMirror(pclient, args.path, workers=args.jobs).sync()
+    except PastebinError as e:
+        print('[-] Pastebin mirror: %s' % e)
+        exit(1)
+    print('[+] %d fetched, %d removed, %d failed' % (
+        len(result['fetched']), len(result['removed']),
+        len(result['failed'])))
+    if result['truncated']:
+        print('[-] Listing truncated, no paste was removed')
+    for key, error in result['failed'].items():
+        print('[-] %s: %s' % (key, error))
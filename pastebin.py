@@ -25,17 +25,347 @@
 
 #############################################################################
 
-from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import functools
 import json
+import threading
+import time
 import urllib
 import xml.etree.ElementTree as ET
-from urllib import request
+from urllib import error, request
 
 
 class PastebinError(RuntimeError):
     """Pastebin API Error.
     The error message returned by the web application is stored as the Python
-    exception message."""
+    exception message.
+
+    The C{retryable} attribute tells whether the same request may succeed
+    later."""
+
+    retryable = False
+
+
+class InvalidKeyError(PastebinError):
+    """The API developer key, the API user key or the credentials are
+    invalid."""
+
+
+class PasteNotFoundError(PastebinError):
+    """The paste does not exist: wrong key, expired or deleted paste."""
+
+
+class PermissionDeniedError(PastebinError):
+    """The account is not allowed to access or remove the paste."""
+
+
+class InvalidRequestError(PastebinError):
+    """The request itself is invalid: bad parameter, or an account limit
+    such as the number of private pastes is reached."""
+
+
+class ThrottledError(PastebinError):
+    """Too many requests: slow down and try again later."""
+
+    retryable = True
+
+
+class ScrapingAccessError(PastebinError):
+    """The IP address is not whitelisted for the scraping API."""
+
+
+class UnavailableError(PastebinError):
+    """Pastebin could not be reached, or failed to answer."""
+
+    retryable = True
+
+
+class CircuitOpenError(UnavailableError):
+    """The endpoint failed too often, requests are not sent until its
+    cool-down is over."""
+
+    def __init__(self, message, retry_after=0):
+        UnavailableError.__init__(self, message)
+        self.retry_after = retry_after
+
+
+# Error types, by (lower case) substrings of the error messages
+_error_types = (
+    ('invalid api_dev_key', InvalidKeyError),
+    ('invalid api_user_key', InvalidKeyError),
+    ('invalid login', InvalidKeyError),
+    ('account not active', InvalidKeyError),
+    ('invalid permission', PermissionDeniedError),
+    ('cannot find', PasteNotFoundError),
+    ('not found', PasteNotFoundError),
+    ('invalid api_paste_key', PasteNotFoundError),
+    ('per 24h', ThrottledError),
+    ('slow down', ThrottledError),
+    ('too many', ThrottledError),
+)
+
+
+def _api_error(message):
+    """Build the error matching an error message of the API.
+
+    @type   message: string
+    @param  message: The error message.
+
+    @rtype: PastebinError
+    @returns: An instance of the most specific error type.
+    """
+
+    lowered = message.lower()
+    for (pattern, error_type) in _error_types:
+        if pattern in lowered:
+            return error_type(message)
+    return InvalidRequestError(message)
+
+
+def _http_error(e, scraping=False):
+    """Build the error matching a failed HTTP request.
+
+    @type   e: OSError
+    @param  e: The error raised by urlopen().
+
+    @type   scraping: boolean
+    @param  scraping: (Optional) Whether a scraping endpoint was called,
+    where HTTP 403 means the IP is not whitelisted.
+
+    @rtype: PastebinError
+    @returns: An instance of the most specific error type.
+    """
+
+    if isinstance(e, error.HTTPError):
+        if e.code == 404:
+            return PasteNotFoundError('HTTP %d: %s' % (e.code, e.reason))
+        if e.code == 429:
+            return ThrottledError('HTTP %d: %s' % (e.code, e.reason))
+        if e.code == 403 and scraping:
+            return ScrapingAccessError('HTTP %d: %s' % (e.code, e.reason))
+        if e.code == 403:
+            return PermissionDeniedError('HTTP %d: %s' % (e.code, e.reason))
+        if e.code < 500:
+            return InvalidRequestError('HTTP %d: %s' % (e.code, e.reason))
+    return UnavailableError(str(e))
+
+
+class CircuitBreaker:
+    """Circuit breaker of a Pastebin endpoint.
+    After C{threshold} consecutive retryable failures, or as soon as the IP
+    is not allowed to scrape, the circuit opens: requests fail fast with
+    CircuitOpenError. Once the cool-down is over, a single request is let
+    through as a probe; it closes the circuit if it succeeds, and opens it
+    again otherwise.
+    """
+
+    def __init__(self, threshold=5, cooldown=30, clock=time.monotonic):
+        """ New CircuitBreaker object.
+
+        @type   threshold: int
+        @param  threshold: (Optional) Consecutive failures opening the
+        circuit.
+
+        @type   cooldown: float
+        @param  cooldown: (Optional) Seconds before probing an open circuit.
+
+        @type   clock: callable
+        @param  clock: (Optional) Returns the current time, in seconds.
+        """
+
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def before(self):
+        """Check whether a request may be sent, raise CircuitOpenError
+        otherwise."""
+
+        with self._lock:
+            if self.state == 'closed':
+                return
+            retry_after = self._opened + self.cooldown - self.clock()
+            if self.state == 'open' and retry_after <= 0:
+                self.state = 'half-open'
+                return
+            raise CircuitOpenError('Circuit open, retry in %.1fs'
+                                   % max(0, retry_after), max(0, retry_after))
+
+    def success(self):
+        """Record a request which reached the endpoint."""
+
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def release(self):
+        """Record a request which failed before reaching the endpoint.
+        A probe of a half-open circuit is allowed again."""
+
+        with self._lock:
+            if self.state == 'half-open':
+                self.state = 'open'
+
+    def failure(self, blocked=False):
+        """Record a failed request.
+
+        @type   blocked: boolean
+        @param  blocked: (Optional) Whether we are blocked, which opens the
+        circuit at once.
+        """
+
+        with self._lock:
+            self.failures += 1
+            if blocked or self.state == 'half-open' \
+                    or self.failures >= self.threshold:
+                self.state = 'open'
+                self._opened = self.clock()
+
+
+class RateLimiter:
+    """Token bucket limiting the rate of calls, shared between threads.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic,
+                 sleep=time.sleep):
+        """ New RateLimiter object.
+
+        @type   rate: float
+        @param  rate: Calls allowed per second.
+
+        @type   burst: int
+        @param  burst: (Optional) Calls allowed at once after a quiet period.
+
+        @type   clock: callable
+        @param  clock: (Optional) Returns the current time, in seconds.
+
+        @type   sleep: callable
+        @param  sleep: (Optional) Waits for a number of seconds.
+        """
+
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a call is allowed."""
+
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.burst, self._tokens
+                                   + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self.sleep(wait)
+
+
+# Circuit breakers of the endpoints shared by all the clients of the IP, by
+# endpoint name. Those of the account endpoints belong to each PastebinAPI.
+circuit_breakers = {}
+
+
+def _endpoint(name, shared=False, scraping=False):
+    """Decorate an API method calling the named endpoint.
+    HTTP and network errors are turned into PastebinError, and the circuit
+    breaker of the endpoint is updated with the outcome of the call.
+
+    Errors scoped to an account, such as throttling or a denied permission,
+    do not count against the endpoint: the breakers of account endpoints
+    are kept by each PastebinAPI object, and only the breakers of shared
+    endpoints, whose methods take no client, are kept in circuit_breakers.
+    """
+
+    if shared:
+        circuit_breakers.setdefault(name, CircuitBreaker())
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if shared:
+                breaker = circuit_breakers[name]
+            else:
+                breaker = args[0].circuit_breaker(name)
+            breaker.before()
+            try:
+                try:
+                    result = method(*args, **kwargs)
+                except OSError as e:
+                    raise _http_error(e, scraping) from e
+            except PastebinError as e:
+                if isinstance(e, ScrapingAccessError):
+                    breaker.failure(blocked=True)
+                elif isinstance(e, ThrottledError) and not shared:
+                    # The account is throttled, not the endpoint
+                    breaker.release()
+                elif e.retryable:
+                    breaker.failure()
+                elif type(e) is PastebinError \
+                        or isinstance(e, PermissionDeniedError):
+                    # Raised before sending anything, e.g. a missing key,
+                    # or telling nothing about the endpoint health
+                    breaker.release()
+                else:
+                    breaker.success()
+                raise
+            except BaseException:
+                breaker.release()
+                raise
+            breaker.success()
+            return result
+        return wrapper
+    return decorator
+
+
+def _parse_xml_fragment(xml):
+    """Parse an XML document made of several top-level elements.
+    Accepts bytes, memoryview or string, without copying nor decoding it.
+
+    @type   xml: bytes
+    @param  xml: The XML elements.
+
+    @rtype: Element
+    @returns: A root element holding the parsed elements.
+    """
+
+    parser = ET.XMLParser()
+    if isinstance(xml, str):
+        (start, end) = ('<root>', '</root>')
+    else:
+        (start, end) = (b'<root>', b'</root>')
+    parser.feed(start)
+    parser.feed(xml)
+    parser.feed(end)
+    return parser.close()
+
+
+def _error_message(response, start=0):
+    """Extract the error message of a response.
+    Only the message itself is copied and decoded, not the whole response.
+
+    @type   response: bytes
+    @param  response: The response holding the error.
+
+    @type   start: int
+    @param  start: (Optional) Offset of the message in the response.
+
+    @rtype: string
+    @returns: The error message.
+    """
+
+    return str(memoryview(response)[start:], 'utf-8', 'replace').strip()
 
 
 class Paste:
@@ -64,6 +394,9 @@ class Paste:
         self.hits = hits
         self.scrape_url = scrape_url
         self.user = user
+        self._client = None
+        self._api_user_key = None
+        self._content = None
 
     def __str__(self):
         if self.scrape_url:
@@ -78,17 +411,111 @@ private %d format (long %s short %s) url %s hits %d' % (
                 self.private, self.format_long, self.format_short, self.url,
                 self.hits)
 
+    def as_dict(self):
+        """Convert the paste into a JSON-serialisable dictionary.
+
+        @rtype: dict
+        @returns: Every field of the paste, dates as ISO 8601 strings.
+        """
+
+        fields = dict((name, value) for (name, value) in vars(self).items()
+                      if not name.startswith('_'))
+        for field in ('date', 'expire_date'):
+            if fields[field] is not None:
+                fields[field] = fields[field].isoformat()
+        return fields
+
+    def bind(self, client, api_user_key=None):
+        """Bind the paste to a client, used to fetch its content.
+
+        @type   client: PastebinAPI
+        @param  client: The client, needed to fetch private pastes.
+
+        @type   api_user_key: string
+        @param  api_user_key: (Optional) The API User key of the owner of the
+        paste. If not provided, the key of the client will be used.
+        """
+
+        self._client = client
+        self._api_user_key = api_user_key
+
+    @property
+    def content(self):
+        """Content of the paste, fetched on first access.
+        Scraped pastes are fetched with the scraping API, private pastes with
+        the bound client, and other pastes with the raw API.
+
+        @rtype: bytes
+        @returns: The content of the paste.
+        """
+
+        if self._content is None:
+            if self.scrape_url:
+                self._content = PastebinAPI.scrape_get_data(self.key)
+            elif self.private == Paste.paste_type.index('private'):
+                if self._client is None:
+                    raise PastebinError('Bind a client to the paste to fetch \
+private content')
+                self._content = self._client.get_user_pastes_content(
+                    self.key, self._api_user_key)
+            else:
+                self._content = PastebinAPI.get_paste(self.key)
+        return self._content
+
+    @property
+    def content_loaded(self):
+        """Whether the content of the paste was already fetched."""
+
+        return self._content is not None
+
+    def prefetch(pastes, workers=8):
+        """Fetch the content of several pastes in parallel.
+        Pastes whose content is already loaded are skipped.
+
+        @type   pastes: array
+        @param  pastes: Paste objects.
+
+        @type   workers: int
+        @param  workers: (Optional) Number of parallel fetches.
+
+        @rtype: dict
+        @returns: Errors met, by key of the paste.
+        """
+
+        pending = [paste for paste in pastes if not paste.content_loaded]
+        failed = {}
+
+        def load(paste):
+            try:
+                paste.content
+            except PastebinError as e:
+                failed[paste.key] = e
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(load, pending):
+                pass
+        return failed
+
 
 class PastesParserXML:
     """Parser for Pastebin pastes.
     To be used with an XML array received from Pastebin.
     """
 
-    def parse(pastes_xml):
+    def parse(pastes_xml, client=None, api_user_key=None):
         """Parse an XML array containing pastes.
 
-        @type   pastes_xml: string
-        @param  pastes_xml: An XML array, representing pastes.
+        @type   pastes_xml: bytes
+        @param  pastes_xml: An XML array, representing pastes. Strings and
+        memoryviews are accepted as well.
+
+        @type   client: PastebinAPI
+        @param  client: (Optional) Client bound to the pastes, to fetch their
+        content. See L{Paste.bind}.
+
+        @type   api_user_key: string
+        @param  api_user_key: (Optional) The API User key of the owner of the
+        pastes.
 
         @rtype: array
         @returns: Array of Paste objects.
@@ -97,8 +524,7 @@ class PastesParserXML:
         if pastes_xml is None:
             return []
 
-        # FIXME Workaround for non-root document
-        tree = ET.fromstring('<root>' + pastes_xml + '</root>')
+        tree = _parse_xml_fragment(pastes_xml)
         pastes_array = []
         paste_elems = {}
         for paste in tree:
@@ -106,7 +532,7 @@ class PastesParserXML:
                 paste_elems[elem.tag] = elem.text
             expire_date = None
             if int(paste_elems['paste_expire_date']) > 0:
-                expire_date = date.fromtimestamp(
+                expire_date = datetime.fromtimestamp(
                     int(paste_elems['paste_expire_date']))
             format_long = None
             if paste_elems['paste_format_long'] != 'None':
@@ -116,7 +542,7 @@ class PastesParserXML:
                 format_short = paste_elems['paste_format_short']
             new_paste = Paste(
                 key=paste_elems['paste_key'],
-                date=date.fromtimestamp(int(paste_elems['paste_date'])),
+                date=datetime.fromtimestamp(int(paste_elems['paste_date'])),
                 title=paste_elems['paste_title'],
                 size=int(paste_elems['paste_size']),
                 expire_date=expire_date,
@@ -126,6 +552,7 @@ class PastesParserXML:
                 url=paste_elems['paste_url'],
                 hits=int(paste_elems['paste_hits'])
             )
+            new_paste.bind(client, api_user_key)
             pastes_array.append(new_paste)
 
         # Prefer a single object instead of an array
@@ -139,11 +566,16 @@ class PastesParserJSON:
     To be used with a JSON array received from Pastebin.
     """
 
-    def parse(pastes_json):
+    def parse(pastes_json, client=None):
         """Parse a JSON array containing pastes.
 
-        @type   pastes_json: string
-        @param  pastes_json: A JSON array, representing pastes.
+        @type   pastes_json: bytes
+        @param  pastes_json: A JSON array, representing pastes. Strings and
+        memoryviews are accepted as well.
+
+        @type   client: PastebinAPI
+        @param  client: (Optional) Client bound to the pastes, to fetch their
+        content. See L{Paste.bind}.
 
         @rtype: array
         @returns: Array of Paste objects.
@@ -152,12 +584,15 @@ class PastesParserJSON:
         if pastes_json is None:
             return []
 
-        tree = json.loads(pastes_json.decode('utf-8'))
+        # The JSON decoder detects the encoding of bytes by itself
+        if isinstance(pastes_json, memoryview):
+            pastes_json = pastes_json.tobytes()
+        tree = json.loads(pastes_json)
         pastes_array = []
         for paste in tree:
             expire_date = None
             if int(paste['expire']) > 0:
-                expire_date = date.fromtimestamp(int(paste['expire']))
+                expire_date = datetime.fromtimestamp(int(paste['expire']))
             format_short = None
             if paste['syntax'] != 'text':
                 format_short = paste['syntax']
@@ -166,7 +601,7 @@ class PastesParserJSON:
                 user = paste['user']
             new_paste = Paste(
                 key=paste['key'],
-                date=date.fromtimestamp(int(paste['date'])),
+                date=datetime.fromtimestamp(int(paste['date'])),
                 title=paste['title'],
                 size=int(paste['size']),
                 expire_date=expire_date,
@@ -176,6 +611,7 @@ class PastesParserJSON:
                 hits=int(paste['hits']),
                 user=user
             )
+            new_paste.bind(client)
             pastes_array.append(new_paste)
 
         # Prefer a single object instead of an array
@@ -228,15 +664,15 @@ class UsersParser:
     def parse(users_xml):
         """Parse an XML array containing users.
 
-        @type   users_xml: string
-        @param  users_xml: An XML array, representing users.
+        @type   users_xml: bytes
+        @param  users_xml: An XML array, representing users. Strings and
+        memoryviews are accepted as well.
 
         @rtype:     array
         @returns:   Array of User objects.
         """
 
-        # FIXME Workaround for non-root document
-        tree = ET.fromstring('<root>' + users_xml + '</root>')
+        tree = _parse_xml_fragment(users_xml)
         users_array = []
         user_elems = {}
         for user in tree:
@@ -265,10 +701,14 @@ class PastebinAPI:
     # Base domain name
     _base_domain = 'pastebin.com'
 
-    # String to determine bad API requests
-    _bad_request = 'Bad API request'
-    _bad_scrape = 'VISIT: https://%s/scraping TO GET ACCESS!' % _base_domain
-    _request_error = 'Error, '
+    # Bytes to determine bad API requests
+    _bad_request = b'Bad API request'
+    _bad_scrape = ('VISIT: https://%s/scraping TO GET ACCESS!'
+                   % _base_domain).encode('utf-8')
+    _request_error = b'Error, '
+
+    # Scraping errors are short, only look for them at the start of a body
+    _bad_scrape_window = 256
 
     # Valid Pastebin URLs
     _prefix_url = 'https://%s/' % _base_domain
@@ -562,7 +1002,27 @@ class PastebinAPI:
 
         self.api_dev_key = api_dev_key
         self.api_user_key = api_user_key
+        self.circuit_breakers = {}
+
+    def circuit_breaker(self, name):
+        """Get the circuit breaker of one of the account endpoints of this
+        client. See L{CircuitBreaker}.
 
+        @type   name: string
+        @param  name: Name of the endpoint: C{'login'}, C{'post'} or
+        C{'raw_api'}.
+
+        @rtype:     CircuitBreaker
+        @returns:   The circuit breaker, created on first use.
+        """
+
+        breaker = self.circuit_breakers.get(name)
+        if breaker is None:
+            breaker = self.circuit_breakers.setdefault(name,
+                                                       CircuitBreaker())
+        return breaker
+
+    @_endpoint('login')
     def generate_user_key(self, username, password):
         """ Generate a user key - needed for private API access.
 
@@ -574,7 +1034,7 @@ class PastebinAPI:
         @param  password: The password of a registered U{https://pastebin.com}
         account.
 
-        @rtype: string
+        @rtype: bytes
         @returns: User key (api_user_key) to allow authenticated
         interaction to the API.
         """
@@ -595,12 +1055,14 @@ class PastebinAPI:
         response = request_string.read()
 
         # Error checking
-        if response.startswith(bytes(self._bad_request, 'utf-8')):
-            raise PastebinError((str(response).split(',')[1]).strip("' "))
+        if response.startswith(self._bad_request):
+            raise _api_error(
+                _error_message(response, response.find(b',') + 1))
 
         self.api_user_key = response
         return response
 
+    @_endpoint('post')
     def paste(self, paste_content, paste_title=None, paste_format=None,
               paste_guest=True, paste_type='public', paste_expire_date='N'):
         """Submit a code snippet to Pastebin.
@@ -671,13 +1133,15 @@ class PastebinAPI:
         response = request_string.read()
 
         # Error checking
-        if response.startswith(self._bad_request.encode('utf-8')):
-            raise PastebinError((str(response).split(',')[1]).strip("' "))
+        if response.startswith(self._bad_request):
+            raise _api_error(
+                _error_message(response, response.find(b',') + 1))
         elif not response.startswith(self._prefix_url.encode('utf-8')):
-            raise PastebinError(response)
+            raise _api_error(_error_message(response))
 
-        return str(response)
+        return str(response, 'utf-8')
 
+    @_endpoint('post')
     def list_user_pastes_mdata(self, api_user_key=None, results_limit=None):
         """Returns all pastes for the provided api_user_key.
 
@@ -691,7 +1155,7 @@ class PastebinAPI:
         @param       results_limit: (Optional) The number of pastes to
         return (1-1000)
 
-        @rtype:      string
+        @rtype:      bytes
         @returns:    An XML containing pastes of the user.
         """
 
@@ -721,21 +1185,23 @@ class PastebinAPI:
         response = request_string.read()
 
         # Error checking
-        if response.startswith(self._bad_request.encode('utf-8')):
-            raise PastebinError((str(response).split(',')[1]).strip("' "))
-        elif response.startswith('No pastes found'.encode('utf-8')):
+        if response.startswith(self._bad_request):
+            raise _api_error(
+                _error_message(response, response.find(b',') + 1))
+        elif response.startswith(b'No pastes found'):
             return None
-        elif not response.startswith('<paste>'.encode('utf-8')):
-            raise PastebinError(response)
+        elif not response.startswith(b'<paste>'):
+            raise _api_error(_error_message(response))
 
-        return str(response)
+        return response
 
+    @_endpoint('post')
     def trending(self):
         """Returns the top trending paste details.
 
         Note: Returns multple trending pastes, not just 1.
 
-        @rtype:     string
+        @rtype:     bytes
         @return:    Returns the XML containing the top trending pastes.
         """
 
@@ -750,11 +1216,13 @@ class PastebinAPI:
         response = request_string.read()
 
         # Error checking
-        if response.startswith(self._bad_request.encode('utf-8')):
-            raise PastebinError((str(response).split(',')[1]).strip("' "))
+        if response.startswith(self._bad_request):
+            raise _api_error(
+                _error_message(response, response.find(b',') + 1))
 
-        return str(response)
+        return response
 
+    @_endpoint('post')
     def delete_paste(self, paste_key, api_user_key=None):
         """ Delete the paste specified by paste_key.
 
@@ -787,11 +1255,13 @@ class PastebinAPI:
         response = request_string.read()
 
         # Error checking
-        if response.startswith(self._bad_request.encode('utf-8')):
-            raise PastebinError((str(response).split(',')[1]).strip("' "))
+        if response.startswith(self._bad_request):
+            raise _api_error(
+                _error_message(response, response.find(b',') + 1))
 
         return True
 
+    @_endpoint('post')
     def user_details(self, api_user_key=None):
         """Return user details for the provided api_user_key.
 
@@ -799,7 +1269,7 @@ class PastebinAPI:
         @param  api_user_key:   (Optional) The API User key of a registered
         Pastebin user. If not provided, your own key will be used instead.
 
-        @rtype:     string
+        @rtype:     bytes
         @returns:   Returns an XML string containing user information.
         """
 
@@ -821,13 +1291,15 @@ details.')
         response = request_string.read()
 
         # Error checking
-        if response.startswith(self._bad_request.encode('utf-8')):
-            raise PastebinError((str(response).split(',')[1]).strip("' "))
-        elif not response.startswith('<user>'.encode('utf-8')):
-            raise PastebinError(response)
+        if response.startswith(self._bad_request):
+            raise _api_error(
+                _error_message(response, response.find(b',') + 1))
+        elif not response.startswith(b'<user>'):
+            raise _api_error(_error_message(response))
 
         return response
 
+    @_endpoint('raw_api')
     def get_user_pastes_content(self, paste_key, api_user_key=None):
         """Returns paste content for a paste key (and it's user's key).
 
@@ -840,7 +1312,7 @@ details.')
         @param       api_user_key: (Optional) The API UserKey of a registered
         user. If you don't provide the user key, your own key will be used.
 
-        @rtype:      string
+        @rtype:      bytes
         @returns:    An XML containing the requested paste.
         """
 
@@ -864,31 +1336,40 @@ details.')
         response = request_string.read()
 
         # Error checking
-        if response.startswith(self._bad_request.encode('utf-8')):
-            raise PastebinError((str(response).split(',')[1]).strip("' "))
+        if response.startswith(self._bad_request):
+            raise _api_error(
+                _error_message(response, response.find(b',') + 1))
 
         return response
 
-    def get_paste(paste_key):
+    @_endpoint('raw', shared=True)
+    def get_paste(paste_key, timeout=None):
         """Get a paste's raw content.
 
         @type paste_key: string
         @param paste_key: The unique key for the paste.
 
-        @rtype: string
+        @type timeout: float
+        @param timeout: (Optional) Seconds to wait for Pastebin.
+
+        @rtype: bytes
         @return: Returns the XML string containing the raw paste.
         """
 
         # POST directly
         url = '%sraw/%s' % (PastebinAPI._prefix_url, paste_key)
-        request_string = request.urlopen(url)
+        if timeout is None:
+            request_string = request.urlopen(url)
+        else:
+            request_string = request.urlopen(url, timeout=timeout)
         response = request_string.read()
 
         # Error checking
-        if response.startswith(PastebinAPI._request_error.encode('utf-8')):
-            raise PastebinError(str(response, 'utf-8').strip("' "))
+        if response.startswith(PastebinAPI._request_error):
+            raise _api_error(_error_message(response))
         return response
 
+    @_endpoint('scraping', shared=True, scraping=True)
     def scrape_recents_pastes(limit=0, language=None):
         """Get most recents pastes from Pastebin.
 
@@ -900,7 +1381,7 @@ details.')
         @type language: string
         @param language: (Optional) Language the pastes must comply to.
 
-        @rtype: string
+        @rtype: bytes
         @return: Returns a JSON array containing recent pastes.
         """
 
@@ -914,18 +1395,19 @@ details.')
 
         # POST
         if len(argv) > 0:
-            url = '%s%s' % (PastebinAPI._api_scraping_url,
-                            urllib.parse.urlencode(argv).encode('utf-8')
-                            )
+            url = '%s?%s' % (PastebinAPI._api_scraping_url,
+                             urllib.parse.urlencode(argv))
         request_string = request.urlopen(url)
         response = request_string.read()
 
         # Error checking
-        if response.find(PastebinAPI._bad_scrape.encode('utf-8')) != -1:
-            raise PastebinError('Not using a whitelisted IP!')
+        if response.find(PastebinAPI._bad_scrape, 0,
+                         PastebinAPI._bad_scrape_window) != -1:
+            raise ScrapingAccessError('Not using a whitelisted IP!')
         return response
 
-    def scrape_get_data(key):
+    @_endpoint('scrape_item', shared=True, scraping=True)
+    def scrape_get_data(key, timeout=None):
         """Get raw data for a paste from Pastebin.
 
         Note: Scraping APIs require IP whitelisting.
@@ -933,7 +1415,10 @@ details.')
         @type key: string
         @param key: Key for the paste to retrieve.
 
-        @rtype: string
+        @type timeout: float
+        @param timeout: (Optional) Seconds to wait for Pastebin.
+
+        @rtype: bytes
         @return: Raw data for the requested paste.
         """
 
@@ -943,18 +1428,22 @@ details.')
         url = '%s?%s' % (base_url, urllib.parse.urlencode(argv))
 
         # POST
-        request_string = request.urlopen(url)
+        if timeout is None:
+            request_string = request.urlopen(url)
+        else:
+            request_string = request.urlopen(url, timeout=timeout)
         response = request_string.read()
 
         # Error checking
-        if response.find(PastebinAPI._bad_scrape.encode('utf-8')) != -1:
-            raise PastebinError(str(response, 'utf-8').strip("' "))
-        elif response.startswith(PastebinAPI._request_error.encode('utf-8')):
-            raise PastebinError(
-                str(response, 'utf-8')[len(PastebinAPI._request_error):]
-            )
+        if response.find(PastebinAPI._bad_scrape, 0,
+                         PastebinAPI._bad_scrape_window) != -1:
+            raise ScrapingAccessError(_error_message(response))
+        elif response.startswith(PastebinAPI._request_error):
+            raise _api_error(_error_message(
+                response, len(PastebinAPI._request_error)))
         return response
 
+    @_endpoint('scrape_item_meta', shared=True, scraping=True)
     def scrape_get_metadata(key):
         """ Get metadata for a paste from Pastebin.
 
@@ -963,7 +1452,7 @@ details.')
         @type key: string
         @param key: Key for the paste to retrieve.
 
-        @rtype: string
+        @rtype: bytes
         @return: Metadata for the requested paste.
         """
 
@@ -977,10 +1466,10 @@ details.')
         response = request_string.read()
 
         # Error checking
-        if response.find(PastebinAPI._bad_scrape.encode('utf-8')) != -1:
-            raise PastebinError(str(response, 'utf-8').strip("' "))
-        if response.startswith(PastebinAPI._request_error.encode('utf-8')):
-            raise PastebinError(
-                str(response, 'utf-8')[len(PastebinAPI._request_error):]
-            )
+        if response.find(PastebinAPI._bad_scrape, 0,
+                         PastebinAPI._bad_scrape_window) != -1:
+            raise ScrapingAccessError(_error_message(response))
+        if response.startswith(PastebinAPI._request_error):
+            raise _api_error(_error_message(
+                response, len(PastebinAPI._request_error)))
         return response
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    poller.py - Adaptive polling of the most recent pastes.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+import heapq
+import threading
+import time
+
+from pastebin import \
+    PastebinAPI, \
+    PastebinError, \
+    PastesParserJSON
+
+
+class RecentsPoller:
+    """Poller of scrape_recents_pastes adapting its interval to the arrival
+    rate of new pastes.
+
+    The rate is estimated from the pastes new since the previous poll and
+    from the time span of their dates, and smoothed. The next interval is
+    the time for new pastes to fill the response but a small overlap with
+    the previous one. A poll without any overlap means pastes were probably
+    missed: it is counted as a gap, along with an estimate of the missed
+    pastes, and the interval is halved at once.
+    """
+
+    def __init__(self, language=None, limit=250, target_overlap=0.1,
+                 min_interval=1.0, max_interval=300.0, smoothing=0.3,
+                 fetch=PastebinAPI.scrape_recents_pastes,
+                 clock=time.monotonic):
+        """ New RecentsPoller object.
+
+        @type   language: string
+        @param  language: (Optional) Language the pastes must comply to.
+
+        @type   limit: int
+        @param  limit: (Optional) Number of pastes per poll (1-250).
+
+        @type   target_overlap: float
+        @param  target_overlap: (Optional) Share of each response expected to
+        overlap with the previous one.
+
+        @type   min_interval: float
+        @param  min_interval: (Optional) Minimum seconds between polls.
+
+        @type   max_interval: float
+        @param  max_interval: (Optional) Maximum seconds between polls.
+
+        @type   smoothing: float
+        @param  smoothing: (Optional) Weight of the newest rate estimate.
+
+        @type   fetch: callable
+        @param  fetch: (Optional) Called with the limit and language, returns
+        the recent pastes as JSON.
+
+        @type   clock: callable
+        @param  clock: (Optional) Returns the current time, in seconds.
+        """
+
+        self.language = language
+        self.limit = limit
+        self.target_overlap = target_overlap
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.smoothing = smoothing
+        self.fetch = fetch
+        self.clock = clock
+        self.interval = min_interval
+        self.rate = None
+        self._previous_keys = None
+        self._previous_poll = None
+        self.stats = {
+            'polls': 0,
+            'new': 0,
+            'overlap': 0,
+            'gaps': 0,
+            'missed_estimate': 0,
+        }
+
+    def _estimate(self, new, elapsed):
+        # Rate from the dates of the new pastes, or from the poll interval
+        dates = [paste.date.timestamp() for paste in new
+                 if paste.date is not None]
+        span = max(dates) - min(dates) if len(dates) > 1 else 0
+        if span > 0:
+            rate = (len(dates) - 1) / span
+        elif elapsed:
+            rate = len(new) / elapsed
+        else:
+            return
+        if self.rate is None:
+            self.rate = rate
+        else:
+            self.rate += self.smoothing * (rate - self.rate)
+
+    def poll(self):
+        """Poll the recent pastes, and adapt the interval.
+
+        @rtype:     array
+        @returns:   Paste objects not returned by the previous poll.
+        """
+
+        now = self.clock()
+        pastes = PastesParserJSON.parse(self.fetch(self.limit,
+                                                   self.language))
+        if not isinstance(pastes, list):
+            pastes = [pastes]
+        keys = set(paste.key for paste in pastes)
+        elapsed = None
+        if self._previous_poll is not None:
+            elapsed = now - self._previous_poll
+
+        if self._previous_keys is None:
+            new = pastes
+            overlap = None
+        else:
+            new = [paste for paste in pastes
+                   if paste.key not in self._previous_keys]
+            overlap = len(pastes) - len(new)
+        self._previous_keys = keys
+        self._previous_poll = now
+        self.stats['polls'] += 1
+        self.stats['new'] += len(new)
+
+        self._estimate(new, elapsed)
+        if overlap is not None:
+            self.stats['overlap'] += overlap
+            if overlap == 0 and len(pastes) >= self.limit:
+                self.stats['gaps'] += 1
+                if self.rate is not None and elapsed:
+                    self.stats['missed_estimate'] += max(
+                        0, int(self.rate * elapsed) - len(pastes))
+                self.interval = max(self.min_interval, self.interval / 2)
+                return new
+
+        if self.rate:
+            fill = self.limit * (1 - self.target_overlap) / self.rate
+            self.interval = min(self.max_interval,
+                                max(self.min_interval, fill))
+        else:
+            self.interval = self.max_interval
+        return new
+
+
+class PollScheduler:
+    """Scheduler of several pollers, e.g. one per language, each on its
+    own cadence.
+    """
+
+    def __init__(self, pollers=(), clock=time.monotonic):
+        """ New PollScheduler object.
+
+        @type   pollers: iterable
+        @param  pollers: (Optional) RecentsPoller objects.
+
+        @type   clock: callable
+        @param  clock: (Optional) Returns the current time, in seconds.
+        """
+
+        self.clock = clock
+        self.pollers = list(pollers)
+        # Failed polls
+        self.errors = 0
+        self._stop = threading.Event()
+
+    def run(self, handler, on_error=None):
+        """Poll until stopped, each poller when it is due.
+        A failed poll, including a malformed response, is counted in
+        C{errors} and the poller is tried again after its interval.
+
+        @type   handler: callable
+        @param  handler: Called with each new paste.
+
+        @type   on_error: callable
+        @param  on_error: (Optional) Called with the poller and the error of
+        each failed poll.
+        """
+
+        due = [(self.clock(), i) for i in range(len(self.pollers))]
+        heapq.heapify(due)
+        while due and not self._stop.is_set():
+            (when, i) = heapq.heappop(due)
+            if self._stop.wait(max(0, when - self.clock())):
+                return
+            poller = self.pollers[i]
+            try:
+                for paste in poller.poll():
+                    handler(paste)
+            except (PastebinError, ValueError) as e:
+                self.errors += 1
+                if on_error is not None:
+                    on_error(poller, e)
+            heapq.heappush(due, (self.clock() + poller.interval, i))
+
+    def stop(self):
+        """Stop polling."""
+
+        self._stop.set()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    retention.py - Retention sweeps of Pastebin accounts.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import os
+import re
+import threading
+
+from pastebin import \
+    PastebinAPI, \
+    PastebinError, \
+    PasteNotFoundError, \
+    PastesParserXML, \
+    RateLimiter
+
+
+class RetentionPolicy:
+    """Criteria selecting the pastes to delete.
+    A paste matches when it meets every criterion given. A policy without
+    any criterion would match every paste, and must be asked for explicitly
+    with C{match_all}.
+    """
+
+    def __init__(self, max_age=None, title_pattern=None, formats=None,
+                 min_size=None, max_size=None, max_hits=None,
+                 match_all=False):
+        """ New RetentionPolicy object.
+
+        @type   max_age: float
+        @param  max_age: (Optional) Pastes older than this number of days.
+
+        @type   title_pattern: string
+        @param  title_pattern: (Optional) Regular expression the start of the
+        title must match, e.g. C{'ci-log '} for a title prefix.
+
+        @type   formats: iterable
+        @param  formats: (Optional) Short formats (syntaxes) of the pastes.
+
+        @type   min_size: int
+        @param  min_size: (Optional) Minimum size of the pastes, in bytes.
+
+        @type   max_size: int
+        @param  max_size: (Optional) Maximum size of the pastes, in bytes.
+
+        @type   max_hits: int
+        @param  max_hits: (Optional) Maximum hits of the pastes.
+
+        @type   match_all: boolean
+        @param  match_all: (Optional) Whether a policy without any criterion,
+        matching every paste, is intended.
+        """
+
+        criteria = (max_age, title_pattern, formats, min_size, max_size,
+                    max_hits)
+        if not match_all and all(criterion is None for criterion in criteria):
+            raise ValueError('No retention criterion, pass match_all to \
+match every paste')
+
+        self.max_age = None
+        if max_age is not None:
+            self.max_age = timedelta(days=max_age)
+        self.title_re = None
+        if title_pattern is not None:
+            self.title_re = re.compile(title_pattern)
+        self.formats = None
+        if formats is not None:
+            self.formats = frozenset(formats)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_hits = max_hits
+
+    def matches(self, paste, now=None):
+        """Check whether a paste must be deleted.
+
+        @type   paste: Paste
+        @param  paste: The paste.
+
+        @type   now: datetime
+        @param  now: (Optional) Current time. Defaults to now.
+
+        @rtype:     boolean
+        @returns:   True if the paste meets every criterion.
+        """
+
+        if self.max_age is not None:
+            if now is None:
+                now = datetime.now()
+            if now - paste.date < self.max_age:
+                return False
+        if self.title_re is not None \
+                and not self.title_re.match(paste.title or ''):
+            return False
+        if self.formats is not None and paste.format_short not in self.formats:
+            return False
+        if self.min_size is not None and paste.size < self.min_size:
+            return False
+        if self.max_size is not None and paste.size > self.max_size:
+            return False
+        if self.max_hits is not None and paste.hits > self.max_hits:
+            return False
+        return True
+
+
+class RetentionSweeper:
+    """Deletion of the pastes matching a policy, across accounts.
+
+    Deletions run concurrently, within a shared rate limit. Every deleted
+    paste is appended to a journal, so that an interrupted sweep can be run
+    again without sending the same deletions twice.
+    """
+
+    def __init__(self, policy, accounts, journal=None, workers=4, rate=2.0,
+                 dry_run=False):
+        """ New RetentionSweeper object.
+
+        @type   policy: RetentionPolicy
+        @param  policy: Policy selecting the pastes to delete.
+
+        @type   accounts: dict
+        @param  accounts: PastebinAPI objects, with a user key, by account
+        name.
+
+        @type   journal: string
+        @param  journal: (Optional) Path of the journal of deleted pastes.
+
+        @type   workers: int
+        @param  workers: (Optional) Number of concurrent deletions.
+
+        @type   rate: float
+        @param  rate: (Optional) Maximum deletions per second.
+
+        @type   dry_run: boolean
+        @param  dry_run: (Optional) Only report the pastes to delete.
+        """
+
+        self.policy = policy
+        self.accounts = accounts
+        self.journal = journal
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.dry_run = dry_run
+        self._journal_lock = threading.Lock()
+
+    def _load_journal(self):
+        done = set()
+        if self.journal is None or not os.path.exists(self.journal):
+            return done
+        with open(self.journal, 'r') as journal_file:
+            for line in journal_file:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) == 2:
+                    done.add(tuple(fields))
+        return done
+
+    def _record(self, journal_file, account, key):
+        if journal_file is None:
+            return
+        with self._journal_lock:
+            journal_file.write('%s\t%s\n' % (account, key))
+            journal_file.flush()
+
+    def plan(self):
+        """List the pastes matching the policy.
+
+        @rtype:     array
+        @returns:   Tuples of account names and Paste objects.
+        """
+
+        now = datetime.now()
+        matched = []
+        for (account, api) in sorted(self.accounts.items()):
+            pastes = PastesParserXML.parse(
+                api.list_user_pastes_mdata(None, 1000))
+            if not isinstance(pastes, list):
+                pastes = [pastes]
+            matched.extend((account, paste) for paste in pastes
+                           if self.policy.matches(paste, now))
+        return matched
+
+    def _delete(self, journal_file, account, key):
+        self.limiter.acquire()
+        try:
+            self.accounts[account].delete_paste(key)
+        except PasteNotFoundError:
+            # Already gone, e.g. expired since the listing
+            pass
+        self._record(journal_file, account, key)
+
+    def sweep(self):
+        """Delete the pastes matching the policy.
+
+        @rtype:     dict
+        @returns:   'deleted' (or, in dry-run mode, to be deleted) and
+        'skipped' (journaled by an earlier run) tuples of account names and
+        keys, and a 'failed' mapping of such tuples to the error met.
+        """
+
+        done = self._load_journal()
+        result = {'deleted': [], 'skipped': [], 'failed': {}}
+        pending = []
+        for (account, paste) in self.plan():
+            if (account, paste.key) in done:
+                result['skipped'].append((account, paste.key))
+            else:
+                pending.append((account, paste.key))
+        if self.dry_run:
+            result['deleted'] = pending
+            return result
+
+        journal_file = None
+        if self.journal is not None:
+            journal_file = open(self.journal, 'a')
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = dict((executor.submit(self._delete, journal_file,
+                                                account, key), (account, key))
+                               for (account, key) in pending)
+                for (future, target) in futures.items():
+                    try:
+                        future.result()
+                        result['deleted'].append(target)
+                    except PastebinError as e:
+                        result['failed'][target] = e
+        finally:
+            if journal_file is not None:
+                journal_file.close()
+        return result
+
+
+if __name__ == "__main__":
+    from client import get_creds
+
+    parser = argparse.ArgumentParser(
+        description='Delete the pastes of Pastebin accounts matching a \
+retention policy')
+    parser.add_argument('-c', '--config', dest='configs', action='append',
+                        help='Configuration file path, one per account')
+    parser.add_argument('--max-age', dest='max_age', type=float,
+                        help='Delete pastes older than this number of days')
+    parser.add_argument('--title', dest='title_pattern',
+                        help='Regular expression matching the start of \
+the titles')
+    parser.add_argument('--format', dest='formats', action='append',
+                        help='Short format of the pastes, can be repeated')
+    parser.add_argument('--min-size', dest='min_size', type=int)
+    parser.add_argument('--max-size', dest='max_size', type=int)
+    parser.add_argument('--max-hits', dest='max_hits', type=int)
+    parser.add_argument('--all', dest='match_all', action='store_true',
+                        help='Delete every paste if no criterion is given')
+    parser.add_argument('-j', '--journal', dest='journal',
+                        default='retention.journal',
+                        help='Journal of the deleted pastes')
+    parser.add_argument('-r', '--rate', dest='rate', type=float, default=2.0,
+                        help='Maximum deletions per second')
+    parser.add_argument('-n', '--dry-run', dest='dry_run',
+                        action='store_true',
+                        help='Only list the pastes to delete')
+    args = parser.parse_args()
+    if not args.configs:
+        args.configs = [os.path.join(os.getenv('HOME'), '.pbcreds')]
+    try:
+        policy = RetentionPolicy(args.max_age, args.title_pattern,
+                                 args.formats, args.min_size, args.max_size,
+                                 args.max_hits, args.match_all)
+    except ValueError:
+        parser.error('give at least one criterion, or --all to delete every \
+paste')
+
+    accounts = {}
+    for config in args.configs:
+        (api_dev_key, username, password) = get_creds(config)
+        pclient = PastebinAPI(api_dev_key)
+        try:
+            pclient.generate_user_key(username, password)
+        except PastebinError as e:
+            print('[-] Pastebin get user key %s: %s' % (username, e))
+            exit(1)
+        accounts[username] = pclient
+
+    sweeper = RetentionSweeper(policy, accounts, journal=args.journal,
+                               rate=args.rate, dry_run=args.dry_run)
+    try:
+        result = sweeper.sweep()
+    except PastebinError as e:
+        print('[-] Pastebin list: %s' % e)
+        exit(1)
+    for (account, key) in result['deleted']:
+        print('[%s] %s %s' % ('?' if args.dry_run else '+', account, key))
+    for ((account, key), error) in result['failed'].items():
+        print('[-] %s %s: %s' % (account, key, error))
+    print('[+] %d %s, %d already done, %d failed' % (
+        len(result['deleted']), 'to delete' if args.dry_run else 'deleted',
+        len(result['skipped']), len(result['failed'])))
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    router.py - Indexed routing of pastes to metadata subscriptions.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+from collections import deque
+import itertools
+import threading
+import time
+
+
+class IntervalTree:
+    """Static centered interval tree, answering which intervals contain a
+    point in O(log n + k).
+    """
+
+    __slots__ = ('center', 'by_low', 'by_high', 'left', 'right')
+
+    def __init__(self, intervals):
+        """ New IntervalTree object.
+
+        @type   intervals: array
+        @param  intervals: Tuples of (low, high, value), bounds included.
+        """
+
+        self.center = None
+        self.by_low = []
+        self.by_high = []
+        self.left = None
+        self.right = None
+        if not intervals:
+            return
+        bounds = sorted(bound for interval in intervals
+                        for bound in interval[:2])
+        self.center = bounds[len(bounds) // 2]
+        left = [interval for interval in intervals
+                if interval[1] < self.center]
+        right = [interval for interval in intervals
+                 if interval[0] > self.center]
+        overlapping = [interval for interval in intervals
+                       if interval[0] <= self.center <= interval[1]]
+        self.by_low = sorted(overlapping, key=lambda interval: interval[0])
+        self.by_high = sorted(overlapping, key=lambda interval: -interval[1])
+        if left:
+            self.left = IntervalTree(left)
+        if right:
+            self.right = IntervalTree(right)
+
+    def stab(self, point):
+        """Find the intervals containing a point.
+
+        @type   point: float
+        @param  point: The point.
+
+        @rtype:     generator
+        @returns:   Values of the intervals containing the point.
+        """
+
+        node = self
+        while node is not None and node.center is not None:
+            if point < node.center:
+                for interval in node.by_low:
+                    if interval[0] > point:
+                        break
+                    yield interval[2]
+                node = node.left
+            elif point > node.center:
+                for interval in node.by_high:
+                    if interval[1] < point:
+                        break
+                    yield interval[2]
+                node = node.right
+            else:
+                for interval in node.by_low:
+                    yield interval[2]
+                return
+
+
+class Subscription:
+    """Subscription to the pastes matching metadata criteria.
+    """
+
+    __slots__ = ('id', 'callback', 'user', 'syntax', 'size', 'date',
+                 'criteria')
+
+    def __init__(self, id, callback, user=None, syntax=None, size=None,
+                 date=None):
+        self.id = id
+        self.callback = callback
+        self.user = user
+        self.syntax = syntax
+        self.size = size
+        self.date = date
+        # Number of criteria a paste must meet
+        self.criteria = sum(1 for criterion in (user, syntax, size, date)
+                            if criterion is not None)
+
+    def __str__(self):
+        return 'Subscription: id %d user %s syntax %s size %s date %s' % (
+            self.id, self.user, self.syntax, self.size, self.date)
+
+
+class SubscriptionRouter:
+    """Dispatch of pastes to the subscriptions they match.
+
+    Subscriptions are indexed by exact user and syntax, and by interval
+    trees over their size and date ranges. Each index gives the
+    subscriptions meeting one criterion; a subscription matches once it
+    was found as many times as it has criteria. The cost of a dispatch thus
+    depends on the matching subscriptions, not on all of them.
+
+    Interval trees are rebuilt on the first dispatch after a change.
+    """
+
+    def __init__(self, window=10000):
+        """ New SubscriptionRouter object.
+
+        @type   window: int
+        @param  window: (Optional) Number of dispatch latencies kept.
+        """
+
+        self.subscriptions = {}
+        self._ids = itertools.count(1)
+        self._by_user = {}
+        self._by_syntax = {}
+        self._match_all = set()
+        self._size_tree = None
+        self._date_tree = None
+        self._latencies = deque(maxlen=window)
+        self.dispatched = 0
+        self._lock = threading.Lock()
+
+    def _bounds(interval, convert=float):
+        (low, high) = interval
+        low = float('-inf') if low is None else convert(low)
+        high = float('inf') if high is None else convert(high)
+        return (low, high)
+
+    def _timestamp(when):
+        return when.timestamp()
+
+    def subscribe(self, callback, user=None, syntax=None, size=None,
+                  date=None):
+        """Subscribe to the pastes meeting every given criterion.
+
+        @type   callback: callable
+        @param  callback: Called with each matching paste.
+
+        @type   user: string
+        @param  user: (Optional) Author of the pastes.
+
+        @type   syntax: string
+        @param  syntax: (Optional) Short format of the pastes; C{'text'} for
+        pastes without syntax highlighting.
+
+        @type   size: tuple
+        @param  size: (Optional) Minimum and maximum size, either may be
+        None.
+
+        @type   date: tuple
+        @param  date: (Optional) Minimum and maximum datetime, either may be
+        None.
+
+        @rtype:     int
+        @returns:   Identifier of the subscription.
+        """
+
+        if size is not None:
+            size = SubscriptionRouter._bounds(size)
+        if date is not None:
+            date = SubscriptionRouter._bounds(
+                date, SubscriptionRouter._timestamp)
+        with self._lock:
+            subscription = Subscription(next(self._ids), callback, user,
+                                        syntax, size, date)
+            self.subscriptions[subscription.id] = subscription
+            if user is not None:
+                self._by_user.setdefault(user, set()).add(subscription.id)
+            if syntax is not None:
+                self._by_syntax.setdefault(syntax, set()).add(
+                    subscription.id)
+            if subscription.criteria == 0:
+                self._match_all.add(subscription.id)
+            if size is not None:
+                self._size_tree = None
+            if date is not None:
+                self._date_tree = None
+            return subscription.id
+
+    def unsubscribe(self, id):
+        """Remove a subscription.
+
+        @type   id: int
+        @param  id: Identifier of the subscription.
+
+        @rtype:     boolean
+        @returns:   Whether the subscription existed.
+        """
+
+        with self._lock:
+            subscription = self.subscriptions.pop(id, None)
+            if subscription is None:
+                return False
+            for (index, value) in ((self._by_user, subscription.user),
+                                   (self._by_syntax, subscription.syntax)):
+                if value is not None:
+                    index[value].discard(id)
+                    if not index[value]:
+                        del index[value]
+            self._match_all.discard(id)
+            if subscription.size is not None:
+                self._size_tree = None
+            if subscription.date is not None:
+                self._date_tree = None
+            return True
+
+    def _tree(self, field):
+        return IntervalTree([getattr(subscription, field)
+                             + (subscription.id,)
+                             for subscription in self.subscriptions.values()
+                             if getattr(subscription, field) is not None])
+
+    def match(self, paste):
+        """Find the subscriptions matching a paste.
+
+        @type   paste: Paste
+        @param  paste: The paste.
+
+        @rtype:     array
+        @returns:   Subscription objects.
+        """
+
+        with self._lock:
+            if self._size_tree is None:
+                self._size_tree = self._tree('size')
+            if self._date_tree is None:
+                self._date_tree = self._tree('date')
+
+            hits = {}
+            candidates = []
+            if paste.user is not None:
+                candidates.append(self._by_user.get(paste.user, ()))
+            candidates.append(self._by_syntax.get(
+                paste.format_short or 'text', ()))
+            if paste.size is not None:
+                candidates.append(self._size_tree.stab(paste.size))
+            if paste.date is not None:
+                candidates.append(self._date_tree.stab(
+                    paste.date.timestamp()))
+            for id in itertools.chain.from_iterable(candidates):
+                hits[id] = hits.get(id, 0) + 1
+
+            subscriptions = self.subscriptions
+            matched = [subscriptions[id] for (id, count) in hits.items()
+                       if count == subscriptions[id].criteria]
+            matched.extend(subscriptions[id] for id in self._match_all)
+            return matched
+
+    def dispatch(self, paste):
+        """Call the callbacks of the subscriptions matching a paste.
+        Only the matching itself is accounted in the dispatch latency.
+
+        @type   paste: Paste
+        @param  paste: The paste.
+
+        @rtype:     int
+        @returns:   Number of matching subscriptions.
+        """
+
+        started = time.perf_counter()
+        matched = self.match(paste)
+        self._latencies.append(time.perf_counter() - started)
+        self.dispatched += 1
+        for subscription in matched:
+            subscription.callback(paste)
+        return len(matched)
+
+    def latency(self):
+        """Summarise the recent dispatch latencies.
+
+        @rtype:     dict
+        @returns:   Number of 'dispatched' pastes, and 'mean', 'p50', 'p99'
+        and 'max' latency of the recent ones, in seconds.
+        """
+
+        latencies = sorted(self._latencies)
+        if not latencies:
+            return {'dispatched': self.dispatched, 'mean': 0, 'p50': 0,
+                    'p99': 0, 'max': 0}
+        return {
+            'dispatched': self.dispatched,
+            'mean': sum(latencies) / len(latencies),
+            'p50': latencies[len(latencies) // 2],
+            'p99': latencies[min(len(latencies) - 1,
+                                 len(latencies) * 99 // 100)],
+            'max': latencies[-1],
+        }
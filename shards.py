@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    shards.py - Sharded scraping over several whitelisted nodes.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+import argparse
+import bisect
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from pastebin import \
+    PastebinAPI, \
+    PastebinError, \
+    PastesParserJSON, \
+    ScrapingAccessError
+
+
+def parse_address(address):
+    """Parse a coordinator address.
+
+    @type   address: string
+    @param  address: Either C{host:port} for TCP, or a path for a Unix
+    socket.
+
+    @rtype:     tuple or string
+    @returns:   The (host, port) tuple, or the socket path.
+    """
+
+    if '/' in address:
+        return address
+    (host, port) = address.rsplit(':', 1)
+    return (host, int(port))
+
+
+class HashRing:
+    """Consistent hashing of paste keys over a set of nodes.
+    Every node is placed several times on the ring, so that keys spread
+    evenly and only about 1/N of them move when a node joins or leaves.
+    """
+
+    def __init__(self, nodes=(), replicas=64):
+        """ New HashRing object.
+
+        @type   nodes: iterable
+        @param  nodes: (Optional) Names of the nodes.
+
+        @type   replicas: int
+        @param  replicas: (Optional) Number of points of each node.
+        """
+
+        self.replicas = replicas
+        self.nodes = frozenset(nodes)
+        points = sorted((HashRing._hash('%s#%d' % (node, i)), node)
+                        for node in self.nodes for i in range(replicas))
+        self._hashes = [point[0] for point in points]
+        self._nodes = [point[1] for point in points]
+
+    def _hash(value):
+        digest = hashlib.md5(value.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big')
+
+    def node_for(self, key):
+        """Find the node owning a key.
+
+        @type   key: string
+        @param  key: The paste key.
+
+        @rtype:     string
+        @returns:   Name of the node, or None if the ring is empty.
+        """
+
+        if not self._hashes:
+            return None
+        i = bisect.bisect(self._hashes, HashRing._hash(key))
+        return self._nodes[i % len(self._nodes)]
+
+
+class _HeartbeatHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline().decode('utf-8'))
+            node = str(message['node'])
+        except (ValueError, KeyError):
+            return
+        reply = self.server.coordinator.heartbeat(
+            node, leaving=message.get('leaving', False))
+        self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class ShardCoordinator:
+    """Membership service of the scraping nodes.
+    Workers send a heartbeat every few seconds and get back the list of live
+    nodes; a node missing heartbeats for C{timeout} seconds is dropped. Every
+    membership change bumps the epoch, so workers know when to rebalance.
+    """
+
+    def __init__(self, address, timeout=15, clock=time.monotonic):
+        """ New ShardCoordinator object.
+
+        @type   address: tuple or string
+        @param  address: (host, port) to listen on, or a Unix socket path.
+
+        @type   timeout: float
+        @param  timeout: (Optional) Seconds after which a silent node is
+        considered gone.
+
+        @type   clock: callable
+        @param  clock: (Optional) Returns the current time, in seconds.
+        """
+
+        self.address = address
+        self.timeout = timeout
+        self.clock = clock
+        self.epoch = 0
+        self._last_seen = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _expire(self):
+        deadline = self.clock() - self.timeout
+        gone = [node for node, seen in self._last_seen.items()
+                if seen < deadline]
+        for node in gone:
+            del self._last_seen[node]
+        if gone:
+            self.epoch += 1
+
+    def heartbeat(self, node, leaving=False):
+        """Record a heartbeat from a node.
+
+        @type   node: string
+        @param  node: Name of the node.
+
+        @type   leaving: boolean
+        @param  leaving: (Optional) Whether the node is shutting down.
+
+        @rtype:     dict
+        @returns:   The current 'epoch' and the sorted list of live 'nodes'.
+        """
+
+        with self._lock:
+            self._expire()
+            if leaving:
+                if self._last_seen.pop(node, None) is not None:
+                    self.epoch += 1
+            else:
+                if node not in self._last_seen:
+                    self.epoch += 1
+                self._last_seen[node] = self.clock()
+            return {'epoch': self.epoch, 'nodes': sorted(self._last_seen)}
+
+    def nodes(self):
+        """List the live nodes.
+
+        @rtype:     array
+        @returns:   Sorted names of the live nodes.
+        """
+
+        with self._lock:
+            self._expire()
+            return sorted(self._last_seen)
+
+    def start(self):
+        """Start serving heartbeats in a background thread."""
+
+        if isinstance(self.address, str):
+            self._server = _UnixServer(self.address, _HeartbeatHandler)
+        else:
+            self._server = _TCPServer(self.address, _HeartbeatHandler)
+            # Report the actual port when binding to port 0
+            self.address = self._server.server_address
+        self._server.coordinator = self
+        thread = threading.Thread(target=self._server.serve_forever,
+                                  daemon=True)
+        thread.start()
+
+    def stop(self):
+        """Stop serving heartbeats."""
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            if isinstance(self.address, str):
+                os.remove(self.address)
+
+
+class ShardWorker:
+    """Scraping node fetching only the pastes it owns.
+    Every worker polls the whole recents stream, but only calls
+    scrape_get_data for the keys the hash ring assigns to it. When the
+    coordinator cannot be reached, the last known membership is kept.
+    """
+
+    def __init__(self, node, coordinator, heartbeat_interval=5,
+                 recents=PastebinAPI.scrape_recents_pastes,
+                 fetcher=PastebinAPI.scrape_get_data, seen_size=10000):
+        """ New ShardWorker object.
+
+        @type   node: string
+        @param  node: Name of this node, unique among the workers.
+
+        @type   coordinator: tuple or string
+        @param  coordinator: Address of the coordinator.
+
+        @type   heartbeat_interval: float
+        @param  heartbeat_interval: (Optional) Seconds between heartbeats.
+
+        @type   recents: callable
+        @param  recents: (Optional) Called with a limit, returns the recent
+        pastes as JSON.
+
+        @type   fetcher: callable
+        @param  fetcher: (Optional) Called with the key of a paste, returns
+        its content.
+
+        @type   seen_size: int
+        @param  seen_size: (Optional) Number of handled keys remembered, to
+        skip keys seen again in the next polls.
+        """
+
+        self.node = node
+        self.coordinator = coordinator
+        self.heartbeat_interval = heartbeat_interval
+        self.recents = recents
+        self.fetcher = fetcher
+        self.seen_size = seen_size
+        self.epoch = None
+        self.ring = HashRing([node])
+        # Failed polls
+        self.errors = 0
+        # Failed fetches of owned pastes
+        self.fetch_errors = 0
+        self._seen = OrderedDict()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _send(self, message):
+        if isinstance(self.coordinator, str):
+            family = socket.AF_UNIX
+        else:
+            family = socket.AF_INET
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.heartbeat_interval)
+            sock.connect(self.coordinator)
+            sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as reply:
+                return json.loads(reply.readline().decode('utf-8'))
+
+    def heartbeat(self):
+        """Send a heartbeat, and rebalance on membership change.
+
+        @rtype:     boolean
+        @returns:   Whether the coordinator could be reached.
+        """
+
+        try:
+            reply = self._send({'node': self.node})
+        except (OSError, ValueError):
+            return False
+        if reply['epoch'] != self.epoch:
+            self.ring = HashRing(reply['nodes'])
+            self.epoch = reply['epoch']
+        return True
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            self.heartbeat()
+
+    def start(self):
+        """Join the coordinator and keep sending heartbeats."""
+
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._heartbeat_loop,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the heartbeats and leave the coordinator."""
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            self._send({'node': self.node, 'leaving': True})
+        except (OSError, ValueError):
+            pass
+
+    def owns(self, key):
+        """Whether this node must fetch a key.
+
+        @type   key: string
+        @param  key: The paste key.
+
+        @rtype:     boolean
+        @returns:   True if the ring assigns the key to this node.
+        """
+
+        return self.ring.node_for(key) == self.node
+
+    def _remember(self, key):
+        self._seen[key] = True
+        if len(self._seen) > self.seen_size:
+            self._seen.popitem(last=False)
+
+    def poll(self, limit=250, on_error=None):
+        """Poll the recent pastes, and fetch the ones owned by this node.
+        A paste whose fetch failed with a retryable error is fetched again
+        if the next polls still return it. ScrapingAccessError is raised, as
+        no other fetch can succeed.
+
+        @type   limit: int
+        @param  limit: (Optional) Number of recent pastes to poll (1-250).
+
+        @type   on_error: callable
+        @param  on_error: (Optional) Called with the error of each failed
+        fetch.
+
+        @rtype:     generator
+        @returns:   Tuples of owned pastes and their content.
+        """
+
+        pastes = PastesParserJSON.parse(self.recents(limit))
+        if not isinstance(pastes, list):
+            pastes = [pastes]
+        for paste in pastes:
+            if paste.key in self._seen or not self.owns(paste.key):
+                continue
+            try:
+                content = self.fetcher(paste.key)
+            except PastebinError as e:
+                self.fetch_errors += 1
+                if isinstance(e, ScrapingAccessError):
+                    raise
+                if not e.retryable:
+                    self._remember(paste.key)
+                if on_error is not None:
+                    on_error(e)
+                continue
+            self._remember(paste.key)
+            yield (paste, content)
+
+    def run(self, handler, interval=60, limit=250, on_error=None):
+        """Poll and fetch until stopped.
+        A failed poll, including a malformed response, is counted in
+        C{errors} and the next one is tried after the interval. Failed
+        fetches are counted in C{fetch_errors}.
+
+        @type   handler: callable
+        @param  handler: Called with each owned paste and its content.
+
+        @type   interval: float
+        @param  interval: (Optional) Seconds between two polls.
+
+        @type   limit: int
+        @param  limit: (Optional) Number of recent pastes to poll (1-250).
+
+        @type   on_error: callable
+        @param  on_error: (Optional) Called with the error of each failed
+        poll or fetch.
+        """
+
+        while not self._stop.is_set():
+            try:
+                for (paste, content) in self.poll(limit, on_error):
+                    handler(paste, content)
+            except (PastebinError, ValueError) as e:
+                self.errors += 1
+                if on_error is not None:
+                    on_error(e)
+            self._stop.wait(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Sharded scraping of Pastebin over several nodes')
+    subparsers = parser.add_subparsers(dest='mode')
+    coordinator_parser = subparsers.add_parser(
+        'coordinator', help='Run the membership coordinator')
+    coordinator_parser.add_argument(
+        'address', help='host:port or Unix socket path to listen on')
+    coordinator_parser.add_argument(
+        '-t', '--timeout', dest='timeout', type=float, default=15,
+        help='Seconds after which a silent node is dropped')
+    worker_parser = subparsers.add_parser(
+        'worker', help='Run a scraping node')
+    worker_parser.add_argument(
+        'address', help='host:port or Unix socket path of the coordinator')
+    worker_parser.add_argument('node', help='Unique name of this node')
+    worker_parser.add_argument(
+        '-i', '--interval', dest='interval', type=float, default=60,
+        help='Seconds between two polls')
+    args = parser.parse_args()
+
+    if args.mode == 'coordinator':
+        coordinator = ShardCoordinator(parse_address(args.address),
+                                       timeout=args.timeout)
+        coordinator.start()
+        try:
+            while True:
+                time.sleep(args.timeout)
+                print('[+] Nodes (epoch %d): %s' % (
+                    coordinator.epoch, ', '.join(coordinator.nodes())))
+        except KeyboardInterrupt:
+            coordinator.stop()
+    elif args.mode == 'worker':
+        worker = ShardWorker(args.node, parse_address(args.address))
+        worker.start()
+        try:
+            worker.run(lambda paste, content: print(paste),
+                       interval=args.interval,
+                       on_error=lambda e: print('[-] Pastebin recents: %s'
+                                                % e))
+        except KeyboardInterrupt:
+            worker.stop()
+    else:
+        parser.print_help()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    shedding.py - Load shedding of the scraped paste stream.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+from collections import deque
+import heapq
+import itertools
+import random
+import threading
+import time
+
+
+def default_weight(paste, now=None):
+    """Weight of a paste when sampling: the higher, the likelier it is kept.
+    Pastes with a syntax, an author, or expiring soon weigh more; very large
+    pastes weigh less.
+
+    @type   paste: Paste
+    @param  paste: The paste.
+
+    @type   now: float
+    @param  now: (Optional) Current time, as a timestamp.
+
+    @rtype:     float
+    @returns:   A positive weight.
+    """
+
+    weight = 1.0
+    if paste.format_short is not None:
+        weight *= 2
+    if paste.user is not None:
+        weight *= 2
+    if paste.expire_date is not None:
+        if now is None:
+            now = time.time()
+        if paste.expire_date.timestamp() - now < 3600:
+            weight *= 1.5
+    if paste.size and paste.size > 1 << 20:
+        weight /= 4
+    return weight
+
+
+class SheddingReport:
+    """What the shedder did with the pastes of one sampling window.
+    """
+
+    __slots__ = ('started', 'ended', 'seen', 'forced', 'kept', 'dropped',
+                 'threshold')
+
+    def __init__(self, started):
+        self.started = started
+        self.ended = None
+        # Pastes offered during the window, priority ones included
+        self.seen = 0
+        # Pastes kept because of a priority rule
+        self.forced = 0
+        # Pastes kept by sampling
+        self.kept = 0
+        # Keys of the dropped pastes
+        self.dropped = []
+        # Sampling threshold: a paste of weight w was kept with probability
+        # min(1, w / threshold)
+        self.threshold = 0.0
+
+    def __str__(self):
+        return 'SheddingReport: seen %d forced %d kept %d dropped %d \
+threshold %.3f' % (self.seen, self.forced, self.kept, len(self.dropped),
+                   self.threshold)
+
+
+class LoadShedder:
+    """Stage between the parsed paste stream and a downstream queue.
+
+    While the queue depth and the lag of the pastes stay below their
+    thresholds, pastes go through untouched. Above them, pastes are
+    sampled in windows: pastes matching a priority rule are always kept,
+    and at most C{sample_size} others are kept per window by priority
+    sampling over their weights.
+
+    Every paste is put in the queue as a (paste, factor) tuple, where
+    factor is the inverse of its inclusion probability (1 when not
+    sampled): summing factors gives unbiased estimates of the counts of
+    the whole stream. Each sampling window is also reported, with the keys
+    of the dropped pastes.
+
+    A window is closed, and its sample released downstream, by the first
+    offer() after it ended. When the stream may go quiet, the caller must
+    also call tick() regularly, e.g. every second, so that the last sample
+    is not held back.
+    """
+
+    def __init__(self, queue, depth_threshold=1000, lag_threshold=300,
+                 sample_size=100, window=10.0, weight=default_weight,
+                 priority_rules=(), reports=1000, clock=time.time,
+                 rng=random.random):
+        """ New LoadShedder object.
+
+        @type   queue: queue.Queue
+        @param  queue: Downstream queue.
+
+        @type   depth_threshold: int
+        @param  depth_threshold: (Optional) Queue depth above which pastes
+        are sampled. Sampling stops once it is back under half of it.
+
+        @type   lag_threshold: float
+        @param  lag_threshold: (Optional) Age of the pastes, in seconds,
+        above which they are sampled.
+
+        @type   sample_size: int
+        @param  sample_size: (Optional) Pastes kept per sampling window, not
+        counting priority ones.
+
+        @type   window: float
+        @param  window: (Optional) Length of a sampling window, in seconds.
+
+        @type   weight: callable
+        @param  weight: (Optional) Called with a paste and the current time,
+        returns its positive weight.
+
+        @type   priority_rules: iterable
+        @param  priority_rules: (Optional) Callables returning True for the
+        pastes which must always be kept.
+
+        @type   reports: int
+        @param  reports: (Optional) Number of window reports kept.
+
+        @type   clock: callable
+        @param  clock: (Optional) Returns the current time, as a timestamp.
+
+        @type   rng: callable
+        @param  rng: (Optional) Returns a random float in [0, 1).
+        """
+
+        self.queue = queue
+        self.depth_threshold = depth_threshold
+        self.lag_threshold = lag_threshold
+        self.sample_size = sample_size
+        self.window = window
+        self.weight = weight
+        self.priority_rules = list(priority_rules)
+        self.clock = clock
+        self.rng = rng
+        self.shedding = False
+        self.reports = deque(maxlen=reports)
+        self.stats = {'passed': 0, 'forced': 0, 'kept': 0, 'dropped': 0}
+        self._reservoir = []
+        self._report = None
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _overloaded(self, paste, now):
+        depth = self.queue.qsize()
+        if paste.date is not None \
+                and now - paste.date.timestamp() >= self.lag_threshold:
+            return True
+        if self.shedding:
+            return depth > self.depth_threshold // 2
+        return depth >= self.depth_threshold
+
+    def offer(self, paste):
+        """Hand a paste to the shedder.
+
+        @type   paste: Paste
+        @param  paste: The paste.
+        """
+
+        with self._lock:
+            now = self.clock()
+            if self._report is not None \
+                    and now - self._report.started >= self.window:
+                self._close_window(now)
+            self.shedding = self._overloaded(paste, now)
+            if not self.shedding and self._report is None:
+                self.stats['passed'] += 1
+                self.queue.put((paste, 1.0))
+                return
+
+            if self._report is None:
+                self._report = SheddingReport(now)
+            self._report.seen += 1
+            if any(rule(paste) for rule in self.priority_rules):
+                self._report.forced += 1
+                self.stats['forced'] += 1
+                self.queue.put((paste, 1.0))
+                return
+
+            # Priority sampling: keep the highest weight / uniform(0, 1]
+            weight = self.weight(paste, now)
+            priority = weight / (1.0 - self.rng())
+            entry = (priority, next(self._counter), paste, weight)
+            if len(self._reservoir) < self.sample_size:
+                heapq.heappush(self._reservoir, entry)
+                return
+            dropped = heapq.heappushpop(self._reservoir, entry)
+            self._report.dropped.append(dropped[2].key)
+            self._report.threshold = max(self._report.threshold,
+                                         dropped[0])
+            self.stats['dropped'] += 1
+
+    def tick(self):
+        """Close the current sampling window if it is over, releasing its
+        sample.
+
+        @rtype:     boolean
+        @returns:   Whether a window was closed.
+        """
+
+        with self._lock:
+            now = self.clock()
+            if self._report is not None \
+                    and now - self._report.started >= self.window:
+                self._close_window(now)
+                return True
+            return False
+
+    def _close_window(self, now):
+        report = self._report
+        threshold = report.threshold
+        for (_, _, paste, weight) in sorted(self._reservoir,
+                                            key=lambda entry: entry[1]):
+            # Inverse of the inclusion probability min(1, w / threshold)
+            factor = max(1.0, threshold / weight)
+            self.queue.put((paste, factor))
+        report.kept = len(self._reservoir)
+        report.ended = now
+        self.stats['kept'] += report.kept
+        self.reports.append(report)
+        self._reservoir = []
+        self._report = None
+
+    def flush(self):
+        """Close the current sampling window, releasing its sample."""
+
+        with self._lock:
+            if self._report is not None:
+                self._close_window(self.clock())
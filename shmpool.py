@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    shmpool.py - Process pool analysis of paste contents in shared memory.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+import argparse
+import bisect
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import os
+import threading
+import time
+import zlib
+
+from entropy import EntropyScanner
+from pastebin import PastebinAPI
+
+
+class SharedArena:
+    """Shared memory block recycled between paste contents.
+
+    Contents are copied at the lowest free offset where they fit, and their
+    space is given back by release(). Free ranges are kept sorted by offset
+    and merged with their neighbours, so the block does not fragment into
+    pieces too small for the next contents.
+    """
+
+    def __init__(self, size, alignment=64):
+        """ New SharedArena object.
+
+        @type   size: int
+        @param  size: Size of the block, in bytes.
+
+        @type   alignment: int
+        @param  alignment: (Optional) Contents start at a multiple of it.
+        """
+
+        self.alignment = alignment
+        size -= size % alignment
+        if size <= 0:
+            raise ValueError('Arena smaller than its alignment')
+        self.size = size
+        self.memory = shared_memory.SharedMemory(create=True, size=size)
+        self.name = self.memory.name
+        self.available = size
+        # Free ranges, as sorted offsets and their lengths
+        self._offsets = [0]
+        self._lengths = [size]
+        self._changed = threading.Condition()
+
+    def _allocate(self, length):
+        for (i, free) in enumerate(self._lengths):
+            if free >= length:
+                offset = self._offsets[i]
+                if free == length:
+                    del self._offsets[i]
+                    del self._lengths[i]
+                else:
+                    self._offsets[i] += length
+                    self._lengths[i] -= length
+                self.available -= length
+                return offset
+        return None
+
+    def store(self, content, timeout=None):
+        """Copy a content in the block, waiting for enough free space.
+
+        @type   content: bytes
+        @param  content: The content, or any bytes-like object.
+
+        @type   timeout: float
+        @param  timeout: (Optional) Seconds to wait for free space. Waits
+        forever by default.
+
+        @rtype:     tuple
+        @returns:   Offset and length of the content, or None on timeout.
+        """
+
+        length = len(content)
+        if length > self.size:
+            raise ValueError('Content larger than the arena: %d bytes'
+                             % length)
+        if length == 0:
+            return (0, 0)
+        reserved = -(-length // self.alignment) * self.alignment
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            offset = self._allocate(reserved)
+            while offset is None:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                self._changed.wait(remaining)
+                offset = self._allocate(reserved)
+        self.memory.buf[offset:offset + length] = content
+        return (offset, length)
+
+    def release(self, offset, length):
+        """Give back the space of a content.
+
+        @type   offset: int
+        @param  offset: Offset of the content.
+
+        @type   length: int
+        @param  length: Length of the content.
+        """
+
+        if length == 0:
+            return
+        length = -(-length // self.alignment) * self.alignment
+        with self._changed:
+            self.available += length
+            i = bisect.bisect(self._offsets, offset)
+            # Merge with the free ranges right after, then right before
+            if i < len(self._offsets) \
+                    and offset + length == self._offsets[i]:
+                length += self._lengths[i]
+                del self._offsets[i]
+                del self._lengths[i]
+            if i > 0 and self._offsets[i - 1] + self._lengths[i - 1] \
+                    == offset:
+                self._lengths[i - 1] += length
+            else:
+                self._offsets.insert(i, offset)
+                self._lengths.insert(i, length)
+            self._changed.notify_all()
+
+    def close(self):
+        """Free the block. Contents still stored are lost."""
+
+        self.memory.close()
+        self.memory.unlink()
+
+
+# Worker process state, set by _attach()
+_memory = None
+_analyse = None
+_scanner = None
+
+
+def _attach(name, analyse):
+    global _memory, _analyse
+    if name is not None:
+        _memory = shared_memory.SharedMemory(name=name)
+    _analyse = analyse
+
+
+def _analyse_shared(offset, length, key):
+    # The view must not outlive the call: its space is reused once the
+    # result is received
+    view = _memory.buf[offset:offset + length]
+    try:
+        return _analyse(key, view)
+    finally:
+        view.release()
+
+
+def _analyse_bytes(key, content):
+    return _analyse(key, content)
+
+
+def scan_secrets(key, content):
+    """Default analysis: high-entropy tokens of a content.
+    See L{EntropyScanner}.
+
+    @type   key: string
+    @param  key: Key of the paste.
+
+    @type   content: memoryview
+    @param  content: The content.
+
+    @rtype:     array
+    @returns:   SecretCandidate objects.
+    """
+
+    global _scanner
+    if _scanner is None:
+        _scanner = EntropyScanner()
+    return _scanner.scan(content)
+
+
+class AnalysisPool:
+    """Process pool analysing paste contents without pickling them.
+
+    Contents are copied once into a SharedArena; the workers are only sent
+    (offset, length, key) descriptors, and read the contents through
+    memoryviews of the block. The space of a content is released when its
+    worker acknowledges it, i.e. when its result is received. When the
+    arena is full, submit() waits for space, bounding the contents in
+    flight.
+
+    Contents larger than the arena are sent to the workers as bytes.
+    """
+
+    def __init__(self, analyse=scan_secrets, arena_size=64 << 20,
+                 workers=None, fetch=PastebinAPI.scrape_get_data):
+        """ New AnalysisPool object.
+
+        @type   analyse: callable
+        @param  analyse: (Optional) Module level function, called in the
+        workers with the key and the content of a paste, as a memoryview
+        which must not be kept. Its result is returned to the caller, and
+        must be picklable.
+
+        @type   arena_size: int
+        @param  arena_size: (Optional) Size of the shared memory, in bytes.
+
+        @type   workers: int
+        @param  workers: (Optional) Number of worker processes. Defaults to
+        the number of CPUs.
+
+        @type   fetch: callable
+        @param  fetch: (Optional) Called with a key, returns the content of
+        the paste.
+        """
+
+        self.fetch = fetch
+        self.arena = SharedArena(arena_size)
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=_attach,
+            initargs=(self.arena.name, analyse))
+        self._lock = threading.Lock()
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'bytes': 0,
+            # Contents sent as bytes, being larger than the arena
+            'oversized': 0,
+        }
+
+    def _done(self, future, offset=None, length=0):
+        if offset is not None:
+            self.arena.release(offset, length)
+        with self._lock:
+            if future.cancelled() or future.exception() is not None:
+                self.stats['failed'] += 1
+            else:
+                self.stats['completed'] += 1
+
+    def submit(self, key, content):
+        """Queue the analysis of a paste content.
+
+        @type   key: string
+        @param  key: Key of the paste.
+
+        @type   content: bytes
+        @param  content: The content, or any bytes-like object.
+
+        @rtype:     concurrent.futures.Future
+        @returns:   Future of the analysis result.
+        """
+
+        with self._lock:
+            self.stats['submitted'] += 1
+            self.stats['bytes'] += len(content)
+        if len(content) > self.arena.size:
+            with self._lock:
+                self.stats['oversized'] += 1
+            future = self._executor.submit(_analyse_bytes, key,
+                                           bytes(content))
+            future.add_done_callback(self._done)
+            return future
+
+        (offset, length) = self.arena.store(content)
+        try:
+            future = self._executor.submit(_analyse_shared, offset, length,
+                                           key)
+        except BaseException:
+            self.arena.release(offset, length)
+            raise
+        future.add_done_callback(
+            lambda future: self._done(future, offset, length))
+        return future
+
+    def analyse(self, key):
+        """Fetch a paste content, and queue its analysis.
+
+        @type   key: string
+        @param  key: Key of the paste.
+
+        @rtype:     concurrent.futures.Future
+        @returns:   Future of the analysis result.
+        """
+
+        return self.submit(key, self.fetch(key))
+
+    def close(self):
+        """Wait for the pending analyses, then stop the workers and free the
+        shared memory.
+        """
+
+        self._executor.shutdown(wait=True)
+        self.arena.close()
+
+
+def checksum(key, content):
+    """Benchmark analysis, cheap enough for the handoff cost to show."""
+
+    return zlib.crc32(content)
+
+
+def _pickling_benchmark(analyse, pastes, workers):
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                   initargs=(None, analyse))
+    # Keep as many contents in flight as the shared pool may
+    window = []
+    for (i, content) in enumerate(pastes):
+        window.append(executor.submit(_analyse_bytes, str(i), content))
+        if len(window) >= 4 * (workers or os.cpu_count()):
+            window.pop(0).result()
+    for future in window:
+        future.result()
+    executor.shutdown()
+
+
+def _shared_benchmark(analyse, pastes, workers, arena_size):
+    pool = AnalysisPool(analyse, arena_size, workers, fetch=None)
+    window = []
+    for (i, content) in enumerate(pastes):
+        window.append(pool.submit(str(i), content))
+        if len(window) >= 4 * (workers or os.cpu_count()):
+            window.pop(0).result()
+    for future in window:
+        future.result()
+    pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Benchmark the shared memory analysis pool against a \
+pickling one')
+    parser.add_argument('-s', '--size', dest='size', type=int, default=256,
+                        help='Size of the corpus, in MB')
+    parser.add_argument('-p', '--paste-size', dest='paste_size', type=int,
+                        default=256, help='Size of each paste, in KB')
+    parser.add_argument('-w', '--workers', dest='workers', type=int,
+                        default=None, help='Number of worker processes')
+    parser.add_argument('-a', '--analysis', dest='analysis',
+                        choices=('checksum', 'secrets'), default='checksum',
+                        help='Analysis run on each paste')
+    args = parser.parse_args()
+
+    analyse = checksum if args.analysis == 'checksum' else scan_secrets
+    paste_size = args.paste_size << 10
+    pastes = [os.urandom(paste_size)
+              for _ in range(max(1, (args.size << 20) // paste_size))]
+    total = len(pastes) * paste_size
+    arena_size = 4 * (args.workers or os.cpu_count()) * paste_size * 2
+    for (name, benchmark, extra) in (
+            ('pickle', _pickling_benchmark, ()),
+            ('shared', _shared_benchmark, (arena_size,))):
+        started = time.perf_counter()
+        benchmark(analyse, pastes, args.workers, *extra)
+        elapsed = time.perf_counter() - started
+        print('%-6s %8.1f MB/s' % (name, total / elapsed / (1 << 20)))
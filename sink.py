@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    sink.py - Batched NDJSON storage of scraped pastes.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+import base64
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+
+class PasteSink:
+    """Newline-delimited JSON storage of pastes and their content.
+
+    Records are queued by the producers and written by a background thread,
+    in batches of one write() each. The file is fsync'ed once enough bytes
+    or time have gone by since the last fsync. Files are rotated by size or
+    age, and rotated files are gzip'ed in the background.
+
+    The queue is bounded: when the disk falls behind, put() blocks the
+    producers until there is room again (or raises queue.Full on timeout).
+    Once a write fails, the queued records are dropped, and the error is
+    raised by put() and close().
+    """
+
+    # Suffix of the files being written, and of rotated files
+    _open_suffix = '.ndjson.part'
+    _closed_suffix = '.ndjson'
+
+    def __init__(self, path, prefix='pastes', batch_size=500,
+                 flush_interval=1.0, fsync_interval=5.0,
+                 fsync_bytes=8 << 20, rotate_bytes=256 << 20,
+                 rotate_interval=3600, compress=True, max_pending=10000):
+        """ New PasteSink object. Call start() before putting records.
+
+        @type   path: string
+        @param  path: Directory holding the files.
+
+        @type   prefix: string
+        @param  prefix: (Optional) Prefix of the file names.
+
+        @type   batch_size: int
+        @param  batch_size: (Optional) Maximum number of records per write.
+
+        @type   flush_interval: float
+        @param  flush_interval: (Optional) Seconds to wait for a batch to
+        fill up before writing it anyway.
+
+        @type   fsync_interval: float
+        @param  fsync_interval: (Optional) Maximum seconds between fsyncs.
+
+        @type   fsync_bytes: int
+        @param  fsync_bytes: (Optional) Maximum bytes written between fsyncs.
+
+        @type   rotate_bytes: int
+        @param  rotate_bytes: (Optional) Size after which a file is rotated.
+
+        @type   rotate_interval: float
+        @param  rotate_interval: (Optional) Age, in seconds, after which a
+        file is rotated.
+
+        @type   compress: boolean
+        @param  compress: (Optional) Whether to gzip rotated files.
+
+        @type   max_pending: int
+        @param  max_pending: (Optional) Number of queued records after which
+        producers are blocked.
+        """
+
+        self.path = path
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.fsync_bytes = fsync_bytes
+        self.rotate_bytes = rotate_bytes
+        self.rotate_interval = rotate_interval
+        self.compress = compress
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._file = None
+        self._file_path = None
+        self._file_opened = 0
+        self._file_bytes = 0
+        self._unsynced_bytes = 0
+        self._last_fsync = 0
+        self._sequence = 0
+        self._writer = None
+        self._error = None
+        self._compressors = []
+        self._blocked_lock = threading.Lock()
+        self.stats = {
+            'records': 0,
+            'bytes': 0,
+            'batches': 0,
+            'fsyncs': 0,
+            'rotations': 0,
+            # Records dropped after a write failed
+            'dropped': 0,
+            # Seconds producers spent blocked on a full queue
+            'blocked': 0.0,
+        }
+
+    def record(paste, content=None):
+        """Serialise a paste and its content into an NDJSON line.
+        Content which is not valid UTF-8 is stored base64-encoded.
+
+        @type   paste: Paste
+        @param  paste: The paste.
+
+        @type   content: bytes
+        @param  content: (Optional) The content of the paste.
+
+        @rtype:     bytes
+        @returns:   The JSON record, ending with a newline.
+        """
+
+        fields = paste.as_dict()
+        if content is not None:
+            try:
+                fields['content'] = str(content, 'utf-8')
+            except UnicodeDecodeError:
+                fields['content'] = str(base64.b64encode(content), 'ascii')
+                fields['content_encoding'] = 'base64'
+        return json.dumps(fields, ensure_ascii=False).encode('utf-8') + b'\n'
+
+    def start(self):
+        """Start the background writer."""
+
+        os.makedirs(self.path, exist_ok=True)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def put(self, paste, content=None, timeout=None):
+        """Queue a paste, blocking while the queue is full.
+
+        @type   paste: Paste
+        @param  paste: The paste.
+
+        @type   content: bytes
+        @param  content: (Optional) The content of the paste.
+
+        @type   timeout: float
+        @param  timeout: (Optional) Maximum seconds to block, after which
+        queue.Full is raised. Blocks for as long as needed by default.
+        """
+
+        if self._error is not None:
+            raise self._error
+        line = PasteSink.record(paste, content)
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            started = time.monotonic()
+            try:
+                self._queue.put(line, timeout=timeout)
+            finally:
+                with self._blocked_lock:
+                    self.stats['blocked'] += time.monotonic() - started
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """Write the queued records, close the file and wait for the
+        compression of rotated files."""
+
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        for compressor in self._compressors:
+            compressor.join()
+        self._compressors = []
+        if self._error is not None:
+            raise self._error
+
+    def _open(self):
+        self._sequence += 1
+        name = '%s-%s-%04d' % (self.prefix,
+                               time.strftime('%Y%m%dT%H%M%S'),
+                               self._sequence)
+        self._file_path = os.path.join(self.path, name)
+        self._file = open(self._file_path + self._open_suffix, 'ab')
+        self._file_opened = time.monotonic()
+        self._file_bytes = 0
+
+    def _fsync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced_bytes = 0
+        self._last_fsync = time.monotonic()
+        self.stats['fsyncs'] += 1
+
+    def _rotate(self):
+        self._fsync()
+        self._file.close()
+        self._file = None
+        closed_path = self._file_path + self._closed_suffix
+        os.replace(self._file_path + self._open_suffix, closed_path)
+        self.stats['rotations'] += 1
+        if self.compress:
+            compressor = threading.Thread(target=PasteSink._gzip,
+                                          args=(closed_path,), daemon=True)
+            compressor.start()
+            self._compressors = [thread for thread in self._compressors
+                                 if thread.is_alive()]
+            self._compressors.append(compressor)
+
+    def _gzip(path):
+        with open(path, 'rb') as source, \
+                gzip.open('%s.gz.part' % path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.replace('%s.gz.part' % path, '%s.gz' % path)
+        os.remove(path)
+
+    def _write(self, batch):
+        if self._file is None:
+            self._open()
+        data = b''.join(batch)
+        self._file.write(data)
+        self._file_bytes += len(data)
+        self._unsynced_bytes += len(data)
+        self.stats['records'] += len(batch)
+        self.stats['bytes'] += len(data)
+        self.stats['batches'] += 1
+
+    def _maintain(self):
+        if self._file is None:
+            return
+        now = time.monotonic()
+        if self._file_bytes >= self.rotate_bytes \
+                or now - self._file_opened >= self.rotate_interval:
+            self._rotate()
+        elif self._unsynced_bytes >= self.fsync_bytes \
+                or (self._unsynced_bytes > 0
+                    and now - self._last_fsync >= self.fsync_interval):
+            self._fsync()
+        else:
+            # Hand the batch to the OS, without waiting for the disk
+            self._file.flush()
+
+    def _write_loop(self):
+        closing = False
+        try:
+            while not closing:
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    try:
+                        line = self._queue.get(
+                            timeout=max(0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if line is None:
+                        closing = True
+                        break
+                    batch.append(line)
+                if batch:
+                    self._write(batch)
+                self._maintain()
+            if self._file is not None:
+                self._rotate()
+        except Exception as e:
+            self._error = e
+            # Keep the queue moving, so that producers do not block forever
+            while not closing:
+                line = self._queue.get()
+                if line is None:
+                    closing = True
+                else:
+                    self.stats['dropped'] += 1
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+#############################################################################
+#    trends.py - Hit velocity tracking of trending pastes.
+#    Copyright (C) 2017 entourloop
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+from collections import deque
+import time
+
+from pastebin import PastesParserXML
+
+
+class TrendSeries:
+    """Hits time series of one trending paste.
+    Only the last samples are kept; velocity (hits per second) and
+    acceleration (hits per second squared) are updated from the previous
+    sample on each new one.
+    """
+
+    __slots__ = ('paste', 'samples', 'velocity', 'acceleration')
+
+    def __init__(self, paste, window):
+        self.paste = paste
+        self.samples = deque(maxlen=window)
+        self.velocity = None
+        self.acceleration = None
+
+    def add(self, timestamp, hits):
+        """Add a sample.
+
+        @type   timestamp: float
+        @param  timestamp: Time of the sample, in seconds.
+
+        @type   hits: int
+        @param  hits: Hits of the paste at that time.
+        """
+
+        if self.samples:
+            (last_timestamp, last_hits) = self.samples[-1]
+            elapsed = timestamp - last_timestamp
+            if elapsed <= 0:
+                return
+            velocity = (hits - last_hits) / elapsed
+            if self.velocity is not None:
+                self.acceleration = (velocity - self.velocity) / elapsed
+            self.velocity = velocity
+        self.samples.append((timestamp, hits))
+
+
+class TrendingTracker:
+    """Tracker of repeated trending() results.
+    Keys dropping out of trending are evicted, so memory only depends on
+    the size of the trending list and of the window.
+    """
+
+    def __init__(self, window=32, clock=time.time):
+        """ New TrendingTracker object.
+
+        @type   window: int
+        @param  window: (Optional) Number of samples kept per paste.
+
+        @type   clock: callable
+        @param  clock: (Optional) Returns the current time, as a timestamp.
+        """
+
+        self.window = window
+        self.clock = clock
+        self.series = {}
+
+    def update(self, trending, timestamp=None):
+        """Add a trending() result.
+
+        @type   trending: bytes or array
+        @param  trending: The XML returned by trending(), or the parsed
+        Paste objects.
+
+        @type   timestamp: float
+        @param  timestamp: (Optional) Time of the result. Defaults to now.
+
+        @rtype:     array
+        @returns:   Keys evicted because they are no longer trending.
+        """
+
+        if timestamp is None:
+            timestamp = self.clock()
+        if not isinstance(trending, list):
+            trending = PastesParserXML.parse(trending)
+            if not isinstance(trending, list):
+                trending = [trending]
+
+        current = set()
+        for paste in trending:
+            current.add(paste.key)
+            series = self.series.get(paste.key)
+            if series is None:
+                series = self.series[paste.key] = TrendSeries(paste,
+                                                              self.window)
+            else:
+                series.paste = paste
+            series.add(timestamp, paste.hits)
+
+        evicted = [key for key in self.series if key not in current]
+        for key in evicted:
+            del self.series[key]
+        return evicted
+
+    def rising(self, limit=None):
+        """List the trending pastes, fastest rising first.
+        Pastes seen only once, without a velocity yet, come last.
+
+        @type   limit: int
+        @param  limit: (Optional) Maximum number of series to return.
+
+        @rtype:     array
+        @returns:   TrendSeries objects.
+        """
+
+        ranked = sorted(self.series.values(),
+                        key=lambda series: (series.velocity is None,
+                                            -(series.velocity or 0),
+                                            -(series.acceleration or 0)))
+        return ranked[:limit]